@@ -0,0 +1,43 @@
+"""delivery and listing indexes
+
+Revision ID: a7c21e5d9f04
+Revises: 5e738203eb7d
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c21e5d9f04'
+down_revision = '5e738203eb7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # reminders due before a time, in time order. covers the due poll, as InnoDB indexes carry the primary key
+    op.create_index('ix_reminders_enabled_time_channel', 'reminders', ['enabled', 'time', 'channel_id'])
+    # a channel's reminders in time order, for look and del
+    op.create_index('ix_reminders_channel_time', 'reminders', ['channel_id', 'time'])
+
+    op.create_index('ix_channels_paused_until', 'channels', ['paused_until'])
+
+    op.create_index('ix_todos_user_guild', 'todos', ['user_id', 'guild_id'])
+    op.create_index('ix_todos_guild_channel', 'todos', ['guild_id', 'channel_id'])
+
+
+def downgrade():
+    # MySQL dropped its own indexes on these foreign keys when the composites above took them over, and won't drop
+    # the composites while a foreign key needs them, so give each foreign key an index of its own again first
+    op.create_index('ix_todos_guild_id', 'todos', ['guild_id'])
+    op.create_index('ix_todos_user_id', 'todos', ['user_id'])
+    op.create_index('ix_reminders_channel_id', 'reminders', ['channel_id'])
+
+    op.drop_index('ix_todos_guild_channel', 'todos')
+    op.drop_index('ix_todos_user_guild', 'todos')
+
+    op.drop_index('ix_channels_paused_until', 'channels')
+
+    op.drop_index('ix_reminders_channel_time', 'reminders')
+    op.drop_index('ix_reminders_enabled_time_channel', 'reminders')
@@ -0,0 +1,28 @@
+"""reminder delivery leases
+
+Revision ID: d41f7b2c8e63
+Revises: a7c21e5d9f04
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.mysql import INTEGER
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f7b2c8e63'
+down_revision = 'a7c21e5d9f04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the delivery worker sending a reminder, and the unix time its claim runs out at
+    op.add_column('reminders', sa.Column('claimed_by', sa.String(64), nullable=True))
+    op.add_column('reminders', sa.Column('claimed_until', INTEGER(unsigned=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column('reminders', 'claimed_until')
+    op.drop_column('reminders', 'claimed_by')
@@ -0,0 +1,177 @@
+import asyncio
+import concurrent.futures
+import traceback
+import typing
+from functools import partial
+
+from sqlalchemy import Table
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DataError, IntegrityError
+
+
+class BatchInserter:
+    def __init__(self, bind: Engine, table: Table, flush_interval: float, max_batch: int,
+                 *, ignore_duplicates: bool = False, max_pending: typing.Optional[int] = None, max_attempts: int = 5):
+        self.bind: Engine = bind
+        self.table: Table = table
+        self.flush_interval: float = flush_interval
+        self.max_batch: int = max_batch
+        self.max_pending: typing.Optional[int] = max_pending
+        self.max_attempts: int = max_attempts
+
+        # rows discarded because the queue was full, i.e. the database fell too far behind
+        self.dropped: int = 0
+        # rows discarded because the database refused them, or kept failing to write them
+        self.rejected: int = 0
+
+        self._statement = table.insert()
+        if ignore_duplicates:
+            self._statement = self._statement.prefix_with('IGNORE')
+
+        # rows stay queued until they've been written, so a write that's interrupted or fails loses nothing
+        self._rows: typing.List[dict] = []
+        # the write in flight, of the rows at the start of the queue
+        self._writing: typing.Optional[asyncio.Future] = None
+        # rows at the start of the write in flight that are done with, written or refused
+        self._handled: int = 0
+        self._attempts: int = 0
+        self._closing: bool = False
+        self._wake: typing.Optional[asyncio.Event] = None
+        self._task: typing.Optional[asyncio.Task] = None
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self._executor: typing.Optional[concurrent.futures.Executor] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop, executor: concurrent.futures.Executor = None):
+        if self._task is None:
+            self._loop = loop
+            self._executor = executor
+            self._wake = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    def add(self, row: dict):
+        if self.max_pending is not None and len(self._rows) >= self.max_pending:
+            if self.dropped == 0:
+                print('Queue for {} is full; dropping rows'.format(self.table.name))
+
+            self.dropped += 1
+            return
+
+        self._rows.append(row)
+
+        if len(self._rows) >= self.max_batch and self._wake is not None:
+            self._wake.set()
+
+    async def flush(self):
+        # returns once everything queued has been written, or a write has failed
+        while self._rows:
+            if self._writing is None:
+                rows = self._rows[:self.max_batch]
+
+                self._writing = self._loop.run_in_executor(self._executor, self._write, rows)
+                self._writing.add_done_callback(partial(self._written, len(rows)))
+
+            writing = self._writing
+
+            # waiting doesn't cancel the write if this is cancelled, e.g. by discord.py's cleanup on shutdown
+            await asyncio.wait({writing})
+
+            if writing.cancelled() or writing.exception() is not None:
+                return
+
+    async def close(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+
+            # let the loop finish its flush rather than cancelling it part way through
+            self._closing = True
+            self._wake.set()
+
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+            # the write the loop left in flight, then the rows added since and any it couldn't write
+            if self._writing is not None:
+                await asyncio.wait({self._writing})
+
+            await self.flush()
+
+            if self._rows:
+                print('{} rows for {} were not written'.format(len(self._rows), self.table.name))
+
+    def _written(self, count: int, future: asyncio.Future):
+        self._writing = None
+
+        if future.cancelled():
+            return
+
+        error = future.exception()
+
+        if error is None:
+            del self._rows[:count]
+            self._attempts = 0
+
+            refused = future.result()
+
+            if refused:
+                self.rejected += len(refused)
+                print('Dropped {} rows that {} refused, e.g. {}'.format(len(refused), self.table.name, refused[0]))
+
+            return
+
+        # don't write again what was written before the failure
+        del self._rows[:self._handled]
+        count -= self._handled
+        self._attempts += 1
+
+        if self._attempts < self.max_attempts:
+            print('Failed to write {} rows to {}, will retry:'.format(count, self.table.name))
+
+        else:
+            # give up, rather than let the queue back up behind them
+            del self._rows[:count]
+            self._attempts = 0
+            self.rejected += count
+
+            print('Failed to write {} rows to {} after {} attempts, dropping them:'.format(
+                count, self.table.name, self.max_attempts))
+
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+    def _write(self, rows: typing.List[dict]) -> typing.List[dict]:
+        # returns the rows the database refused
+        self._handled = 0
+
+        return self._insert(rows)
+
+    def _insert(self, rows: typing.List[dict]) -> typing.List[dict]:
+        # one multi-row INSERT per batch. if a row breaks a constraint, e.g. an event of a guild removed since, the
+        # batch is split in halves until that row is found, so the rest are still written
+        try:
+            with self.bind.begin() as connection:
+                connection.execute(self._statement.values(rows))
+
+        except (IntegrityError, DataError):
+            if len(rows) == 1:
+                self._handled += 1
+
+                return rows
+
+            middle = len(rows) // 2
+
+            return self._insert(rows[:middle]) + self._insert(rows[middle:])
+
+        self._handled += len(rows)
+
+        return []
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wake.clear()
+            await self.flush()
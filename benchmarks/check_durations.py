@@ -0,0 +1,59 @@
+"""
+Checks the interval word tables in durations.py: that no word means two things within a language, and that each
+language's example phrases parse as intended. Run after editing the tables. From the repository root:
+
+    python benchmarks/check_durations.py
+
+Exits with status 1 if anything fails.
+"""
+
+import os
+import sys
+import typing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from durations import UNITS, NUMBERS, CONNECTORS, MINUTE, HOUR, DAY, YEAR, parse_duration
+
+# language code -> (text, seconds)
+EXAMPLES: typing.Dict[str, typing.List[typing.Tuple[str, int]]] = {
+    'EN': [('2 hours and 30 min', 2 * HOUR + 30 * MINUTE), ('an hour', HOUR), ('1y', YEAR), ('a day', DAY)],
+    'DE': [('2 Stunden und 30 Minuten', 2 * HOUR + 30 * MINUTE), ('ein Tag', DAY), ('1 h und 30 min', 90 * MINUTE)],
+    'ES': [('2 horas y 30 minutos', 2 * HOUR + 30 * MINUTE), ('1 hora y 30 minutos', 90 * MINUTE),
+           ('2 h y 30 min', 2 * HOUR + 30 * MINUTE), ('un año', YEAR), ('an hour', HOUR)],
+    'FR': [('une heure et 30 minutes', HOUR + 30 * MINUTE), ('un an', YEAR), ('2 ans', 2 * YEAR),
+           ('an hour', HOUR), ('1 h et 30 min', 90 * MINUTE)],
+    'NL': [('2 uur en 30 minuten', 2 * HOUR + 30 * MINUTE), ('een dag', DAY), ('1 h en 30 min', 90 * MINUTE)],
+}
+
+
+def main() -> int:
+    failures = []
+
+    for language in UNITS:
+        tables = {'units': set(UNITS[language]), 'numbers': set(NUMBERS[language]),
+                  'connectors': set(CONNECTORS[language])}
+
+        for first, second in (('units', 'numbers'), ('units', 'connectors'), ('numbers', 'connectors')):
+            overlap = tables[first] & tables[second]
+
+            if overlap:
+                failures.append('{} {} and {} overlap: {}'.format(language, first, second, ', '.join(sorted(overlap))))
+
+    for language, examples in EXAMPLES.items():
+        for text, expected in examples:
+            parsed = parse_duration(text, language)
+
+            if parsed != expected:
+                failures.append('{} parses "{}" as {}, not {}'.format(language, text, parsed, expected))
+
+    for failure in failures:
+        print('FAIL  {}'.format(failure))
+
+    print('{} languages checked, {} failures'.format(len(UNITS), len(failures)))
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+Benchmarks for the time parsing paths: TimeExtractor, natural language times, intervals and timezone lookup.
+
+Runs offline, without Discord or MySQL. From the repository root:
+
+    python benchmarks/time_parsing.py                 # report, and compare against the saved baseline if there is one
+    python benchmarks/time_parsing.py --save          # report, and save the results as the new baseline
+    python benchmarks/time_parsing.py --threshold 0.1 # fail if anything is over 10% slower than the baseline
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+import typing
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import timezones
+from durations import parse_duration
+from natural import NaturalParser
+from time_extractor import TimeExtractor, InvalidTime, extract_many
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+ZONES: typing.List[str] = ['Europe/London', 'America/New_York', 'Asia/Kolkata', 'Australia/Sydney', 'UTC']
+
+RELATIVE: typing.List[str] = ['10s', '5m', '1h', '1h30m', '2d12h', '7d', '-15m', '90', '1d2h3m4s', '48h']
+EXPLICIT: typing.List[str] = ['9:30', '23:59:59', '25/12', '1/1/2030', '25/12-9:30', '14-18:00', '31/1-0:00:00']
+
+# phrases matched without dateparser, and phrases that need it
+FAST_NATURAL: typing.List[str] = [
+    'in 5 minutes', '2 hours', 'in an hour and 30 minutes', 'tomorrow', 'at 5pm', 'tomorrow at 9:30am', '17:45']
+SLOW_NATURAL: typing.List[typing.Tuple[str, str]] = [
+    ('friday', 'EN'), ('1st of january', 'EN'), ('next week', 'EN'), ('december 25th at 8am', 'EN'),
+    ('freitag', 'DE'), ('mañana', 'ES'), ('demain', 'FR'), ('morgen', 'NL')]
+
+INTERVALS: typing.List[typing.Tuple[str, str]] = [
+    ('day', 'EN'), ('2 hours 30 min', 'EN'), ('week', 'EN'), ('a fortnight', 'EN'), ('3h', 'EN'),
+    ('2 stunden', 'DE'), ('3 semanas', 'ES'), ('un mois', 'FR'), ('1 uur en 30 minuten', 'NL')]
+
+ZONE_INPUT: typing.List[str] = ['Europe/London', 'london', 'new york', 'us/eastern', 'Londn', 'tokyo', 'europe/ber']
+
+
+async def run_directly(method: typing.Callable):
+    return method()
+
+
+def extract(strings: typing.List[str], exact: bool):
+    for string in strings:
+        for zone in ZONES:
+            parser = TimeExtractor(string, zone)
+
+            try:
+                parser.extract_exact() if exact else parser.extract_displacement()
+
+            except InvalidTime:
+                pass
+
+
+def natural_fast(parser: NaturalParser):
+    for phrase in FAST_NATURAL:
+        for zone in ZONES:
+            parser.parse_fast(phrase, zone, 'EN')
+
+
+def natural_slow(parser: NaturalParser, loop: asyncio.AbstractEventLoop, cold: bool):
+    async def parse_all():
+        for phrase, language in SLOW_NATURAL:
+            for zone in ZONES:
+                await parser.parse(phrase, zone, language, run_directly)
+
+    if cold:
+        parser.results.clear()
+        parser.seen.clear()
+
+    loop.run_until_complete(parse_all())
+
+
+def intervals():
+    # bypass the memo so the grammar itself is measured
+    for text, language in INTERVALS:
+        parse_duration.__wrapped__(text, language)
+
+
+def zone_lookup():
+    for text in ZONE_INPUT:
+        timezones.resolve.__wrapped__(text)
+
+
+def cases(loop: asyncio.AbstractEventLoop) -> typing.Dict[str, typing.Tuple[typing.Callable, int]]:
+    # name -> (one pass over a corpus, operations in that pass)
+    parser = NaturalParser(10000)
+
+    return {
+        'extractor/relative/exact': (partial(extract, RELATIVE, True), len(RELATIVE) * len(ZONES)),
+        'extractor/relative/displacement': (partial(extract, RELATIVE, False), len(RELATIVE) * len(ZONES)),
+        'extractor/explicit/exact': (partial(extract, EXPLICIT, True), len(EXPLICIT) * len(ZONES)),
+        'extractor/batch': (partial(extract_many, [(s, z) for s in RELATIVE + EXPLICIT for z in ZONES]),
+                            (len(RELATIVE) + len(EXPLICIT)) * len(ZONES)),
+        'natural/fast': (partial(natural_fast, parser), len(FAST_NATURAL) * len(ZONES)),
+        'natural/dateparser': (partial(natural_slow, parser, loop, True), len(SLOW_NATURAL) * len(ZONES)),
+        'natural/cached': (partial(natural_slow, parser, loop, False), len(SLOW_NATURAL) * len(ZONES)),
+        'interval/grammar': (intervals, len(INTERVALS)),
+        'timezone/resolve': (zone_lookup, len(ZONE_INPUT)),
+    }
+
+
+def measure(method: typing.Callable, operations: int, min_time: float, repeats: int) -> typing.Dict[str, float]:
+    method()  # warm up caches and lazy imports
+
+    best = float('inf')
+
+    for _ in range(repeats):
+        passes = 0
+        start = time.perf_counter()
+
+        while (elapsed := time.perf_counter() - start) < min_time:
+            method()
+            passes += 1
+
+        best = min(best, elapsed / passes)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    method()
+
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # blocks allocated during the pass that were still alive at its end, and the high water mark
+    retained = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+
+    return {
+        'ops_per_sec': operations / best,
+        'retained_blocks_per_op': retained / operations,
+        'peak_bytes_per_op': peak / operations,
+    }
+
+
+def main() -> int:
+    arguments = argparse.ArgumentParser(description='Benchmark the time parsing paths')
+    arguments.add_argument('--save', action='store_true', help='save the results as the new baseline')
+    arguments.add_argument('--threshold', type=float, default=0.25,
+                           help='fraction of the baseline ops/sec a case may lose before failing')
+    arguments.add_argument('--min-time', type=float, default=0.2, help='seconds to run each repeat for')
+    arguments.add_argument('--repeats', type=int, default=3)
+    arguments.add_argument('--filter', default='', help='only run cases whose name contains this')
+    args = arguments.parse_args()
+
+    baseline: typing.Dict[str, typing.Dict[str, float]] = {}
+
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    loop = asyncio.new_event_loop()
+    results: typing.Dict[str, typing.Dict[str, float]] = {}
+    regressions: typing.List[str] = []
+
+    print('{:<34}{:>14}{:>12}{:>16}{:>14}'.format('case', 'ops/sec', 'vs base', 'peak B/op', 'retained/op'))
+
+    for name, (method, operations) in cases(loop).items():
+        if args.filter not in name:
+            continue
+
+        result = measure(method, operations, args.min_time, args.repeats)
+        results[name] = result
+
+        change = ''
+        if name in baseline:
+            ratio = result['ops_per_sec'] / baseline[name]['ops_per_sec']
+            change = '{:+.1%}'.format(ratio - 1)
+
+            if ratio < 1 - args.threshold:
+                regressions.append(name)
+
+        print('{:<34}{:>14,.0f}{:>12}{:>16,.0f}{:>14.2f}'.format(
+            name, result['ops_per_sec'], change, result['peak_bytes_per_op'], result['retained_blocks_per_op']))
+
+    loop.close()
+
+    if args.save:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({**baseline, **results}, f, indent=2, sort_keys=True)
+
+        print('Saved baseline to {}'.format(BASELINE_PATH))
+
+    if regressions:
+        print('Slower than the baseline by more than {:.0%}: {}'.format(args.threshold, ', '.join(regressions)))
+
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
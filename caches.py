@@ -0,0 +1,81 @@
+import typing
+from collections import OrderedDict
+from time import monotonic
+
+
+class LRUCache:
+    def __init__(self, max_size: int, ttl: typing.Optional[float] = None):
+        self.max_size: int = max_size
+        self.ttl: typing.Optional[float] = ttl
+
+        # key -> (expiry, value). ordered least to most recently used
+        self._entries: OrderedDict = OrderedDict()
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+
+        if entry is not None and (entry[0] is None or entry[0] > monotonic()):
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[1]
+
+        else:
+            if entry is not None:
+                del self._entries[key]
+
+            self.misses += 1
+
+            return None
+
+    def set(self, key, value):
+        expiry = None if self.ttl is None else monotonic() + self.ttl
+
+        self._entries[key] = (expiry, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        ratio = 0 if total == 0 else self.hits / total
+
+        return '{} hits, {} misses ({:.1%}), {}/{} entries'.format(
+            self.hits, self.misses, ratio, len(self._entries), self.max_size)
+
+
+class GuildSettings(typing.NamedTuple):
+    id: int
+    prefix: str
+    timezone: str
+
+
+class UserIdentity(typing.NamedTuple):
+    id: int
+    user: int
+    dm_channel: typing.Optional[int]
+    language: str
+    timezone: typing.Optional[str]
+
+
+class ChannelRecord(typing.NamedTuple):
+    id: int
+    guild_id: typing.Optional[int]
+    name: str
+    blacklisted: bool
+    nudge: int
+    paused: bool
+    webhook: bool
@@ -1,5 +1,5 @@
 from tinyconf.deserializers import IniDeserializer
-from tinyconf.fields import IntegerField, Field, BooleanField
+from tinyconf.fields import IntegerField, Field, BooleanField, FloatField
 from tinyconf.section import Section
 
 
@@ -16,6 +16,23 @@ class Config(IniDeserializer):
 
     ignore_bots = BooleanField(default=False)
 
+    # 0 parses dates on the shared thread pool; more runs them in that many worker processes
+    parse_workers = IntegerField(default=0)
+    parse_max_in_flight = IntegerField(default=32)
+    parse_timeout = FloatField(default=5.0)
+
+    # deliver reminders from the bot process rather than the external postman. don't run both
+    delivery_engine = BooleanField(default=False)
+    # split delivery between this many processes by channel. the bot delivers partition delivery_worker
+    delivery_workers = IntegerField(default=1)
+    delivery_worker = IntegerField(default=0)
+    # reminders found well overdue, e.g. after downtime, are sent at this many a second, oldest first, and at most
+    # catchup_channel_cap a minute to each channel. 0 sends them all at once
+    catchup_rate = IntegerField(default=20)
+    catchup_channel_cap = IntegerField(default=5)
+    # send a repeating reminder once for all of the occurrences it missed, rather than once each
+    catchup_collapse = BooleanField(default=True)
+
     DEFAULT = Section(
         patreon_role,
         patreon_server,
@@ -24,5 +41,14 @@ class Config(IniDeserializer):
         token,
         local_timezone,
         local_language,
-        ignore_bots
+        ignore_bots,
+        parse_workers,
+        parse_max_in_flight,
+        parse_timeout,
+        delivery_engine,
+        delivery_workers,
+        delivery_worker,
+        catchup_rate,
+        catchup_channel_cap,
+        catchup_collapse
     )
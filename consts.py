@@ -1,3 +1,5 @@
+import typing
+
 from enums import CreateReminderResponse
 from discord import AllowedMentions
 
@@ -9,6 +11,48 @@ DAY_LENGTH: int = 86400
 MAX_TIME_DAYS: int = MAX_TIME // DAY_LENGTH
 MIN_INTERVAL: int = 800
 
+DATABASE_WORKERS: int = 8
+
+NATURAL_CACHE_SIZE: int = 10000
+
+GUILD_CACHE_SIZE: int = 10000
+GUILD_CACHE_TTL: int = 600
+
+USER_CACHE_SIZE: int = 50000
+USER_CACHE_TTL: int = 600
+
+CHANNEL_CACHE_SIZE: int = 50000
+CHANNEL_CACHE_TTL: int = 600
+
+RESTRICTION_CACHE_SIZE: int = 10000
+RESTRICTION_CACHE_TTL: int = 600
+
+MEMBERSHIP_CACHE_SIZE: int = 500000
+MEMBERSHIP_BATCH_SIZE: int = 500
+MEMBERSHIP_FLUSH_INTERVAL: float = 5
+
+AUDIT_MAX_PENDING: int = 10000
+AUDIT_BATCH_SIZE: int = 200
+AUDIT_FLUSH_INTERVAL: float = 0.5
+
+DELIVERY_WINDOW: int = 3600
+DELIVERY_MAX_LOADED: int = 100000
+DELIVERY_WHEEL_SLOTS: typing.Tuple[int, ...] = (60, 60, 24)
+DELIVERY_REFRESH_INTERVAL: float = 60
+DELIVERY_CONCURRENCY: int = 50
+DELIVERY_PAUSE_RECHECK: int = 60
+DELIVERY_RESCHEDULE_INTERVAL: float = 1
+DELIVERY_LEASE: int = 300
+DELIVERY_CATCHUP_THRESHOLD: int = 60
+DELIVERY_CATCHUP_WINDOW: float = 60
+
+PAUSE_RESYNC_INTERVAL: float = 600
+
+HTTP_CONNECTIONS: int = 100
+HTTP_KEEPALIVE: float = 60
+WEBHOOK_CONCURRENCY: int = 50
+WEBHOOK_MAX_ATTEMPTS: int = 3
+
 REMIND_STRINGS: dict = {
     CreateReminderResponse.OK: 'remind/success',
     CreateReminderResponse.LONG_TIME: 'remind/long_time',
@@ -0,0 +1,368 @@
+import asyncio
+import concurrent.futures
+import typing
+from datetime import datetime
+from functools import partial
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import sessionmaker, joinedload
+
+from caches import ChannelRecord, GuildSettings, UserIdentity
+from models import engine, Channel, User, Reminder, Message, Todo, Guild, CommandRestriction, Role
+
+
+class Database:
+    def __init__(self, max_workers: int):
+        # bounded so a slow database can only tie up this pool, never the event loop
+        self._executor: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='database')
+
+        # objects are read after commit in the calling coroutine, so don't expire them
+        self._session_factory: sessionmaker = sessionmaker(bind=engine, expire_on_commit=False)
+
+    async def run(self, method: typing.Callable, *args):
+        # call method(session, *args) on the pool within a session of its own, committing if it returns
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self._executor, partial(self._call, method, *args))
+
+    def _call(self, method: typing.Callable, *args):
+        session = self._session_factory()
+
+        try:
+            result = method(session, *args)
+            session.commit()
+
+            return result
+
+        except:
+            session.rollback()
+            raise
+
+        finally:
+            session.close()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def channel_record(channel: Channel) -> ChannelRecord:
+    return ChannelRecord(
+        id=channel.id, guild_id=channel.guild_id, name=channel.name, blacklisted=channel.blacklisted,
+        nudge=channel.nudge, paused=channel.paused, webhook=channel.webhook_id is not None)
+
+
+def user_identity(user: User) -> UserIdentity:
+    return UserIdentity(
+        id=user.id, user=user.user, dm_channel=user.dm_channel, language=user.language, timezone=user.timezone)
+
+
+def load_channel(session, discord_channel, guild_id: typing.Optional[int]) -> (ChannelRecord, bool):
+    channel, new = Channel.get_or_create(session, discord_channel, guild_id)
+
+    if channel.guild_id is None:
+        channel.guild_id = guild_id
+
+    session.flush()
+
+    return channel_record(channel), new
+
+
+def store_webhook(session, channel_id: int, webhook_id: int, webhook_token: str) -> ChannelRecord:
+    channel = session.query(Channel).get(channel_id)
+
+    if channel.webhook_id is None:
+        channel.webhook_id = webhook_id
+        channel.webhook_token = webhook_token
+
+        session.flush()
+
+    return channel_record(channel)
+
+
+def load_guild_settings(session, guild_id: int) -> GuildSettings:
+    guild = session.query(Guild).filter(Guild.guild == guild_id).first()
+
+    if guild is None:
+        guild = Guild(guild=guild_id)
+
+        session.add(guild)
+        session.flush()
+
+    return GuildSettings(id=guild.id, prefix=guild.prefix, timezone=guild.timezone)
+
+
+# commands still work on ORM objects in their own session. these load them off the event loop, detached, for the
+# command's session to merge without querying again
+
+def load_guild_row(session, guild_id: int) -> typing.Optional[Guild]:
+    return session.query(Guild).get(guild_id)
+
+
+def load_user_row(session, member_id: int) -> typing.Optional[User]:
+    return session.query(User).filter(User.user == member_id).first()
+
+
+def command_restrictions(session, guild_id: int) -> typing.Dict[str, typing.FrozenSet[int]]:
+    # command name -> discord ids of roles allowed to use it
+    roles: typing.Dict[str, typing.Set[int]] = {}
+
+    for command, role in session.query(CommandRestriction.command, Role.role) \
+            .join(CommandRestriction.role) \
+            .filter(CommandRestriction.guild_id == guild_id):
+        roles.setdefault(command, set()).add(role)
+
+    return {command: frozenset(role_ids) for command, role_ids in roles.items()}
+
+
+def load_user(session, member_id: int) -> typing.Optional[UserIdentity]:
+    user = session.query(User).filter(User.user == member_id).first()
+
+    return None if user is None else user_identity(user)
+
+
+def create_user(session, member_id: int, name: str, dm_channel_id: int) -> UserIdentity:
+    channel = session.query(Channel).filter(Channel.channel == dm_channel_id).first()
+
+    if channel is None:
+        channel = Channel(channel=dm_channel_id)
+
+        session.add(channel)
+        session.flush()
+
+    user = User(user=member_id, name=name, dm_channel=channel.id)
+
+    session.add(user)
+    session.flush()
+
+    return user_identity(user)
+
+
+def add_reminder(session, channel_id: int, text: str, time: int, interval: typing.Optional[int], method: str,
+                 set_by: int) -> int:
+    # noinspection PyArgumentList
+    reminder = Reminder(
+        message=Message(content=text),
+        channel_id=channel_id,
+        time=time,
+        enabled=True,
+        method=method,
+        interval=interval,
+        set_by=set_by)
+
+    session.add(reminder)
+    session.flush()
+
+    return reminder.id
+
+
+class Delivery(typing.NamedTuple):
+    id: int
+    time: int
+    interval: typing.Optional[int]
+    enabled: bool
+
+    content: str
+    embed_title: typing.Optional[str]
+    embed_description: typing.Optional[str]
+    embed_color: typing.Optional[int]
+    username: str
+    avatar: str
+
+    channel: int
+    webhook_id: typing.Optional[int]
+    webhook_token: typing.Optional[str]
+    paused: bool
+    paused_until: typing.Optional[float]
+
+
+def upcoming_reminders(session, before: int, limit: int, partition: typing.Tuple[int, int]) \
+        -> typing.List[typing.Tuple[int, int, int]]:
+    # (id, time, channel id), all read from ix_reminders_enabled_time_channel
+    query = session.query(Reminder.id, Reminder.time, Reminder.channel_id) \
+        .filter(Reminder.enabled) \
+        .filter(Reminder.time < before)
+
+    index, count = partition
+    if count > 1:
+        query = query.filter(Reminder.channel_id % count == index)
+
+    return query \
+        .order_by(Reminder.time) \
+        .limit(limit) \
+        .all()
+
+
+def claim_reminders(session, reminder_ids: typing.Collection[int], worker: str, now: int, lease_until: int) \
+        -> typing.List[int]:
+    # take the due reminders that no other worker holds a live claim on. a worker that dies mid-delivery leaves its
+    # claims to run out, so its reminders are sent by the next worker to load them
+    session.query(Reminder) \
+        .filter(Reminder.id.in_(reminder_ids)) \
+        .filter(Reminder.enabled) \
+        .filter(Reminder.time <= now) \
+        .filter(or_(Reminder.claimed_until.is_(None), Reminder.claimed_until < now, Reminder.claimed_by == worker)) \
+        .update({Reminder.claimed_by: worker, Reminder.claimed_until: lease_until}, synchronize_session=False)
+
+    return [reminder_id for reminder_id, in session.query(Reminder.id)
+            .filter(Reminder.id.in_(reminder_ids))
+            .filter(Reminder.claimed_by == worker)
+            .filter(Reminder.claimed_until == lease_until)]
+
+
+def load_delivery(session, reminder_id: int) -> typing.Optional[Delivery]:
+    row = session.query(Reminder, Channel) \
+        .join(Channel, Reminder.channel_id == Channel.id) \
+        .options(joinedload(Reminder.message).joinedload(Message.embed)) \
+        .filter(Reminder.id == reminder_id) \
+        .first()
+
+    if row is None:
+        return None
+
+    reminder, channel = row
+    embed = reminder.message.embed
+
+    return Delivery(
+        id=reminder.id, time=reminder.time, interval=reminder.interval, enabled=reminder.enabled,
+        content=reminder.message.content,
+        embed_title=None if embed is None else embed.title,
+        embed_description=None if embed is None else embed.description,
+        embed_color=None if embed is None else embed.color,
+        username=reminder.username, avatar=reminder.avatar,
+        channel=channel.channel, webhook_id=channel.webhook_id, webhook_token=channel.webhook_token,
+        paused=channel.paused,
+        paused_until=None if channel.paused_until is None else channel.paused_until.timestamp())
+
+
+def reschedule_reminders(session, reminder_ids: typing.Collection[int], now: int, worker: str, collapse: bool) \
+        -> typing.List[typing.Tuple[int, int]]:
+    # after delivery, move interval reminders on and delete the rest, in one statement each however many were
+    # delivered. returns the new times of the reminders still enabled. reminders whose claim was lost to another
+    # worker are left for it to move on
+    if collapse:
+        # skip every occurrence missed while the reminder was late, to the first after now
+        next_time = Reminder.time + Reminder.interval * (func.floor((now - Reminder.time) / Reminder.interval) + 1)
+    else:
+        # only to the next occurrence, which is due straight away again if it was missed too
+        next_time = Reminder.time + Reminder.interval
+
+    session.query(Reminder) \
+        .filter(Reminder.id.in_(reminder_ids)) \
+        .filter(Reminder.claimed_by == worker) \
+        .filter(Reminder.interval > 0) \
+        .filter(Reminder.time <= now) \
+        .update({Reminder.time: next_time, Reminder.claimed_by: None, Reminder.claimed_until: None},
+                synchronize_session=False)
+
+    session.query(Reminder) \
+        .filter(Reminder.id.in_(reminder_ids)) \
+        .filter(Reminder.claimed_by == worker) \
+        .filter(or_(Reminder.interval.is_(None), Reminder.interval == 0)) \
+        .delete(synchronize_session=False)
+
+    return session.query(Reminder.id, Reminder.time) \
+        .filter(Reminder.id.in_(reminder_ids)) \
+        .filter(Reminder.enabled) \
+        .filter(Reminder.claimed_by.is_(None)) \
+        .all()
+
+
+def paused_channels(session) -> typing.List[typing.Tuple[int, typing.Optional[float]]]:
+    return [
+        (channel_id, None if until is None else until.timestamp())
+        for channel_id, until in session.query(Channel.id, Channel.paused_until).filter(Channel.paused)
+    ]
+
+
+def expire_pauses(session, now: datetime) -> (typing.List[typing.Tuple[int, int]], typing.Optional[float]):
+    # unpause every channel whose pause has ended, returning their (id, discord id) and when the next pause ends
+    expired = session.query(Channel.id, Channel.channel).filter(Channel.paused_until <= now).all()
+
+    if expired:
+        session.query(Channel) \
+            .filter(Channel.paused_until <= now) \
+            .update({Channel.paused: False, Channel.paused_until: None}, synchronize_session=False)
+
+    next_expiry = session.query(func.min(Channel.paused_until)).filter(Channel.paused_until > now).scalar()
+
+    return expired, None if next_expiry is None else next_expiry.timestamp()
+
+
+def channel_reminders(session, channel_id: int, enabled_only: bool, limit: typing.Optional[int]) \
+        -> typing.List[typing.Tuple[str, int, bool]]:
+    query = session.query(Reminder) \
+        .options(joinedload(Reminder.message).joinedload(Message.embed)) \
+        .filter(Reminder.channel_id == channel_id) \
+        .order_by(Reminder.time)
+
+    if enabled_only:
+        query = query.filter(Reminder.enabled)
+
+    if limit is not None:
+        query = query.limit(limit)
+
+    return [(r.message_content(), r.time, r.enabled) for r in query]
+
+
+def deletable_reminders(session, guild_id: typing.Optional[int], channel_id: typing.Optional[int]) \
+        -> typing.List[typing.Tuple[int, str, str, int]]:
+    query = session.query(Reminder, Channel.channel) \
+        .join(Channel, Reminder.channel_id == Channel.id) \
+        .options(joinedload(Reminder.message).joinedload(Message.embed))
+
+    if guild_id is not None:
+        query = query.filter(Channel.guild_id == guild_id)
+    else:
+        query = query.filter(Reminder.channel_id == channel_id)
+
+    return [
+        (r.id, r.message_content(), '<#{}>'.format(channel), r.time)
+        for r, channel in query.order_by(Channel.id, Reminder.id)
+    ]
+
+
+def delete_reminders(session, reminder_ids: typing.Collection[int]) -> int:
+    return session.query(Reminder) \
+        .filter(Reminder.id.in_(reminder_ids)) \
+        .delete(synchronize_session=False)
+
+
+def offset_reminders(session, seconds: int, guild_id: typing.Optional[int], channel_id: typing.Optional[int]) -> int:
+    query = session.query(Reminder)
+
+    if guild_id is not None:
+        query = query.filter(Reminder.channel_id.in_(session.query(Channel.id).filter(Channel.guild_id == guild_id)))
+    else:
+        query = query.filter(Reminder.channel_id == channel_id)
+
+    return query.update({Reminder.time: Reminder.time + seconds}, synchronize_session=False)
+
+
+def list_todos(session, user_id: typing.Optional[int], guild_id: typing.Optional[int],
+               channel_id: typing.Optional[int]) -> typing.List[typing.Tuple[int, str]]:
+    query = session.query(Todo.id, Todo.value)
+
+    if channel_id is not None:
+        # the channel's own todos, followed by those for the whole guild
+        query = query \
+            .filter((Todo.channel_id == channel_id) | ((Todo.guild_id == guild_id) & Todo.channel_id.is_(None))) \
+            .order_by(Todo.channel_id.is_(None), Todo.id)
+
+    else:
+        query = query \
+            .filter(Todo.user_id == user_id) \
+            .filter(Todo.guild_id.is_(None)) \
+            .order_by(Todo.id)
+
+    return query.all()
+
+
+def add_todo(session, value: str, user_id: int, guild_id: typing.Optional[int], channel_id: typing.Optional[int]):
+    session.add(Todo(value=value, user_id=user_id, guild_id=guild_id, channel_id=channel_id))
+
+
+def delete_todos(session, todo_ids: typing.Collection[int]) -> int:
+    return session.query(Todo) \
+        .filter(Todo.id.in_(todo_ids)) \
+        .delete(synchronize_session=False)
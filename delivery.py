@@ -0,0 +1,445 @@
+import asyncio
+import heapq
+import os
+import socket
+import traceback
+import typing
+from time import time as unix_time
+
+import aiohttp
+import discord
+
+import database
+from webhooks import WebhookError
+from timing_wheel import TimingWheel
+
+
+# returned in place of a retry time once a reminder has been sent, or given up on
+DELIVERED: int = -1
+
+
+def worker_name() -> str:
+    # unique to this process, so a restarted worker doesn't take over claims its previous run might still be sending
+    return '{}:{}'.format(socket.gethostname(), os.getpid())[-64:]
+
+
+class DeliveryEngine:
+    def __init__(self, client: discord.Client, window: int, refresh_interval: float, concurrency: int,
+                 pause_recheck: int, wheel_slots: typing.Sequence[int], max_loaded: int, reschedule_interval: float,
+                 partition: typing.Tuple[int, int], worker: str, lease: int, catchup_rate: int,
+                 catchup_channel_cap: int, catchup_threshold: int, catchup_window: float, collapse: bool):
+        self.client: discord.Client = client
+        # (index, count). this engine only delivers reminders whose channel id is index modulo count
+        self.partition: typing.Tuple[int, int] = partition
+        # names this engine's claims on the reminders it's sending, which run out lease seconds after being made
+        self.worker: str = worker
+        self.lease: int = lease
+
+        # reminders more than catchup_threshold seconds late, e.g. after downtime, are a backlog. it's sent oldest
+        # first, catchup_rate a second and at most catchup_channel_cap to a channel each catchup_window seconds, so
+        # it doesn't go out in one burst that gets rate limited. a rate of 0 sends everything straight away
+        self.catchup_rate: int = catchup_rate
+        self.catchup_channel_cap: int = catchup_channel_cap
+        self.catchup_threshold: int = catchup_threshold
+        self.catchup_window: float = catchup_window
+        # send an interval reminder once however many of its occurrences were missed, rather than once for each
+        self.collapse: bool = collapse
+        self.refresh_interval: float = refresh_interval
+        self.reschedule_interval: float = reschedule_interval
+        self.concurrency: int = concurrency
+        self.pause_recheck: int = pause_recheck
+
+        self.delivered: int = 0
+        self.failed: int = 0
+        self.lost_claims: int = 0
+        self.caught_up: int = 0
+
+        # reminder id -> due time, a second per tick. only the loaded window is held, and at most max_loaded of it,
+        # so memory doesn't grow with the number of reminders stored
+        self._wheel: TimingWheel = TimingWheel(1, wheel_slots)
+        # start the wheel at the current time, so overdue reminders loaded later don't wind it back
+        self._wheel.advance(unix_time())
+        # reminder id -> channel id, for the reminders in the wheel that came from a refresh. lets paused channels be
+        # held back without reading the reminder
+        self._channels: typing.Dict[int, int] = {}
+        self._sending: typing.Set[int] = set()
+        # delivered reminders waiting to be moved on or deleted. they stay in _sending until then, as their rows
+        # still have the time they were delivered for
+        self._delivered: typing.List[int] = []
+        self._next_reschedule: float = 0
+        self._rescheduling: bool = False
+
+        # (due time, reminder id) of the backlog. held are those over their channel's cap until the window ends
+        self._backlog: typing.List[typing.Tuple[int, int]] = []
+        self._held: typing.List[typing.Tuple[int, int]] = []
+        # channel id -> backlog reminders sent to it this window
+        self._channel_sends: typing.Dict[int, int] = {}
+        self._window_ends: float = 0
+        self._next_drain: float = 0
+
+        self.window: int = min(window, self._wheel.span)
+        self.max_loaded: int = max_loaded
+
+        # every enabled reminder due before this is in the wheel or being sent
+        self._loaded_until: float = 0
+        self._next_refresh: float = 0
+        # set while the overdue reminders alone fill max_loaded. more are read once fewer than this are held
+        self._refill_below: typing.Optional[int] = None
+        self._sleeping_until: float = 0
+
+        self._wake: typing.Optional[asyncio.Event] = None
+        self._slots: typing.Optional[asyncio.Semaphore] = None
+        self._task: typing.Optional[asyncio.Task] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._task = loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def owns(self, channel_id: int) -> bool:
+        index, count = self.partition
+
+        return channel_id % count == index
+
+    def push(self, reminder_id: int, time: int, channel_id: typing.Optional[int] = None):
+        if channel_id is not None:
+            if not self.owns(channel_id):
+                return
+
+            self._channels[reminder_id] = channel_id
+
+        # anything due after the loaded window is picked up by the refresh that reaches it
+        if time < self._loaded_until:
+            self._queue(reminder_id, time)
+        else:
+            self._channels.pop(reminder_id, None)
+
+    def cancel(self, reminder_ids: typing.Iterable[int]):
+        for reminder_id in reminder_ids:
+            self._wheel.cancel(reminder_id)
+            self._channels.pop(reminder_id, None)
+
+    def _queue(self, reminder_id: int, time: int):
+        if reminder_id in self._sending:
+            return
+
+        self._wheel.insert(reminder_id, time)
+
+        if self._wake is not None and time < self._sleeping_until:
+            self._wake.set()
+
+    def request_refresh(self):
+        # for changes made in bulk, e.g. offsets, which may have moved reminders earlier than they're queued for
+        self._next_refresh = 0
+
+        if self._wake is not None:
+            self._wake.set()
+
+    def __len__(self):
+        return len(self._wheel)
+
+    def stats(self) -> str:
+        text = '{} delivered, {} failed, {} queued'.format(self.delivered, self.failed, len(self._wheel))
+        backlog = self._backlog + self._held
+
+        if backlog:
+            text += ', catching up on {} (oldest {}s late)'.format(len(backlog), round(unix_time() - min(backlog)[0]))
+
+        return text + ', {} caught up'.format(self.caught_up)
+
+    async def _refresh(self, now: float):
+        until = now + self.window
+        upcoming = await self.client.database.run(
+            database.upcoming_reminders, int(until), self.max_loaded, self.partition)
+
+        truncated = len(upcoming) >= self.max_loaded
+
+        if truncated:
+            # too many reminders are due in the window to hold at once, so only load up to the last second that was
+            # read in full. if that's all of them, they're all due together and have to be held anyway
+            until = upcoming[-1][1]
+            upcoming = [row for row in upcoming if row[1] < until] or upcoming
+
+        self._loaded_until = until
+
+        if truncated and until <= now:
+            # a backlog, e.g. after downtime. reading again before much of it has been sent would only return the
+            # same rows, so wait until half of what was read has gone, or the usual interval
+            self._next_refresh = now + self.refresh_interval
+            self._refill_below = len(upcoming) // 2
+
+        else:
+            self._next_refresh = max(min(now + self.refresh_interval, until), now + 1)
+            self._refill_below = None
+
+        for reminder_id, time, channel_id in upcoming:
+            self._channels[reminder_id] = channel_id
+            self._queue(reminder_id, time)
+
+    async def _run(self):
+        while True:
+            now = unix_time()
+
+            if self._refill_below is not None and len(self._sending) + len(self._wheel) < self._refill_below:
+                self._next_refresh = now
+                self._refill_below = None
+
+            if now >= self._next_refresh:
+                try:
+                    await self._refresh(now)
+
+                except Exception:
+                    print('Failed to load upcoming reminders:')
+                    traceback.print_exc()
+
+                    self._next_refresh = now + self.refresh_interval
+                    self._refill_below = None
+
+            due: typing.List[int] = []
+
+            for reminder_id, time in self._wheel.advance(now):
+                resume_at = self._paused_until(reminder_id, now)
+
+                if resume_at is not None:
+                    # a pause too long for the wheel is held by each refresh reading the reminder again instead
+                    if not self._wheel.insert(reminder_id, resume_at):
+                        self._channels.pop(reminder_id, None)
+
+                    continue
+
+                self._sending.add(reminder_id)
+
+                if self.catchup_rate > 0 and now - time > self.catchup_threshold:
+                    heapq.heappush(self._backlog, (time, reminder_id))
+                else:
+                    due.append(reminder_id)
+
+            drain_at = self._drain_at()
+
+            if drain_at is not None and now >= drain_at:
+                due.extend(self._drain(now))
+                drain_at = self._drain_at()
+
+            if due:
+                asyncio.ensure_future(self._claim(due))
+
+            if self._delivered and not self._rescheduling and now >= self._next_reschedule:
+                self._rescheduling = True
+                self._next_reschedule = now + self.reschedule_interval
+
+                asyncio.ensure_future(self._reschedule())
+
+            next_due = self._wheel.next_due()
+
+            self._sleeping_until = self._next_refresh if next_due is None else min(next_due, self._next_refresh)
+
+            if self._delivered and not self._rescheduling:
+                self._sleeping_until = min(self._sleeping_until, self._next_reschedule)
+
+            if drain_at is not None:
+                self._sleeping_until = min(self._sleeping_until, drain_at)
+            self._wake.clear()
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(self._sleeping_until - unix_time(), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def _drain_at(self) -> typing.Optional[float]:
+        # when the backlog can next be sent from, or None if there's no backlog
+        if self._backlog:
+            return self._next_drain
+        elif self._held:
+            return self._window_ends
+        else:
+            return None
+
+    def _drain(self, now: float) -> typing.List[int]:
+        # take the next second's worth of the backlog
+        if now >= self._window_ends:
+            self._window_ends = now + self.catchup_window
+            self._channel_sends.clear()
+
+            for entry in self._held:
+                heapq.heappush(self._backlog, entry)
+            self._held = []
+
+        batch: typing.List[int] = []
+
+        while self._backlog and len(batch) < self.catchup_rate:
+            time, reminder_id = heapq.heappop(self._backlog)
+            channel_id = self._channels.get(reminder_id)
+
+            if channel_id is not None:
+                sent = self._channel_sends.get(channel_id, 0)
+
+                if sent >= self.catchup_channel_cap:
+                    self._held.append((time, reminder_id))
+                    continue
+
+                self._channel_sends[channel_id] = sent + 1
+
+            batch.append(reminder_id)
+
+        self.caught_up += len(batch)
+        self._next_drain = now + 1
+
+        return batch
+
+    def _paused_until(self, reminder_id: int, now: float) -> typing.Optional[int]:
+        # when to look at a reminder again if its channel is known to be paused. reminders of unknown channels are read
+        # anyway, and the pause checked against the database
+        channel_id = self._channels.get(reminder_id)
+
+        if channel_id is None or not self.client.pauses.is_paused(channel_id, now):
+            return None
+
+        until = self.client.pauses.paused[channel_id]
+
+        return int(now) + self.pause_recheck if until is None else int(until) + 1
+
+    async def _claim(self, reminder_ids: typing.List[int]):
+        # claim every reminder that came due together in one statement, so workers whose partitions overlap, e.g.
+        # while they're being resized, never send the same reminder twice
+        now = int(unix_time())
+
+        try:
+            claimed = set(await self.client.database.run(
+                database.claim_reminders, reminder_ids, self.worker, now, now + self.lease))
+
+        except Exception:
+            print('Failed to claim {} due reminders:'.format(len(reminder_ids)))
+            traceback.print_exc()
+
+            claimed = set()
+
+        for reminder_id in reminder_ids:
+            if reminder_id in claimed:
+                asyncio.ensure_future(self._deliver(reminder_id))
+
+            else:
+                # held by another worker, or moved since it was loaded. the next refresh loads it again if it's
+                # still due, by when the other worker's claim has either been released or run out
+                self.lost_claims += 1
+                self._sending.discard(reminder_id)
+                self._channels.pop(reminder_id, None)
+
+    async def _reschedule(self):
+        reminder_ids, self._delivered = self._delivered, []
+
+        try:
+            rescheduled = await self.client.database.run(
+                database.reschedule_reminders, reminder_ids, int(unix_time()), self.worker, self.collapse)
+
+        except Exception:
+            print('Failed to reschedule {} delivered reminders:'.format(len(reminder_ids)))
+            traceback.print_exc()
+
+            rescheduled = []
+
+        finally:
+            self._sending.difference_update(reminder_ids)
+            self._rescheduling = False
+
+        # deleted, disabled or lost to another worker. push keeps the channels of the rest only while they're queued
+        for reminder_id in set(reminder_ids).difference(reminder_id for reminder_id, _ in rescheduled):
+            self._channels.pop(reminder_id, None)
+
+        for reminder_id, time in rescheduled:
+            self.push(reminder_id, time)
+
+        self._wake.set()
+
+    async def _deliver(self, reminder_id: int):
+        next_time = None
+
+        try:
+            async with self._slots:
+                next_time = await self._deliver_once(reminder_id)
+
+        except Exception:
+            print('Failed to deliver reminder {}:'.format(reminder_id))
+            traceback.print_exc()
+
+            self.failed += 1
+
+        if next_time is None:
+            self._channels.pop(reminder_id, None)
+
+        if next_time == DELIVERED:
+            self._delivered.append(reminder_id)
+
+            if not self._rescheduling and self._next_reschedule <= unix_time():
+                self._wake.set()
+
+        else:
+            self._sending.discard(reminder_id)
+
+            if next_time is not None:
+                self.push(reminder_id, next_time)
+
+    async def _deliver_once(self, reminder_id: int) -> typing.Optional[int]:
+        # returns DELIVERED, a time to try again at, or None to drop the reminder
+        # read the reminder again at send time so edits, deletions and pauses since it was queued are respected
+        reminder: typing.Optional[database.Delivery] = await self.client.database.run(
+            database.load_delivery, reminder_id)
+        now = unix_time()
+
+        if reminder is None or not reminder.enabled:
+            return None
+
+        elif reminder.time > now:
+            return reminder.time
+
+        elif reminder.paused and (reminder.paused_until is None or reminder.paused_until > now):
+            # held back until the channel is unpaused
+            if reminder.paused_until is None:
+                return int(now) + self.pause_recheck
+            else:
+                return int(reminder.paused_until) + 1
+
+        try:
+            await self.send(reminder)
+            self.delivered += 1
+
+        except (discord.HTTPException, WebhookError, aiohttp.ClientError) as e:
+            # don't retry; a reminder that can't be sent now would otherwise be retried forever
+            print('Failed to send reminder {} to {}: {}'.format(reminder.id, reminder.channel, e))
+            self.failed += 1
+
+        return DELIVERED
+
+    async def send(self, reminder: database.Delivery):
+        embed: typing.Optional[discord.Embed] = None
+
+        if reminder.embed_title or reminder.embed_description:
+            # unset fields must be left out, as discord.Embed would send None as the text "None"
+            fields = {'title': reminder.embed_title, 'description': reminder.embed_description,
+                      'colour': reminder.embed_color}
+
+            embed = discord.Embed(**{name: value for name, value in fields.items() if value})
+
+        content: typing.Optional[str] = reminder.content or None
+
+        if content is None and embed is None:
+            return
+
+        if reminder.webhook_id is not None:
+            payload = {'content': content, 'username': reminder.username, 'avatar_url': reminder.avatar}
+
+            if embed is not None:
+                payload['embeds'] = [embed.to_dict()]
+
+            await self.client.webhooks.send(reminder.webhook_id, reminder.webhook_token, payload)
+
+        else:
+            # DM channels, and guild channels where the bot couldn't make a webhook
+            channel = self.client.get_channel(reminder.channel) or await self.client.fetch_channel(reminder.channel)
+
+            await channel.send(content=content, embed=embed)
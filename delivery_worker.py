@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import signal
+import typing
+
+import aiohttp
+import discord
+
+import database
+from config import Config
+from consts import *
+from delivery import DeliveryEngine, worker_name
+from pauses import PauseSweeper
+from webhooks import WebhookSender
+
+# delivers one partition of the reminders without a gateway connection, so delivery can be spread over several
+# processes. run one per partition besides the bot's own:
+#
+#   python delivery_worker.py 1
+#
+# where delivery_workers in config.ini is the number of partitions, and the bot delivers partition delivery_worker
+
+
+class DeliveryWorker(discord.Client):
+    def __init__(self, index: int, *args, **kwargs):
+        super(DeliveryWorker, self).__init__(*args, **kwargs)
+
+        self.config: Config = Config(filename='config.ini')
+
+        self.database: database.Database = database.Database(DATABASE_WORKERS)
+        self.c_session: typing.Optional[aiohttp.ClientSession] = None
+
+        self.webhooks: WebhookSender = WebhookSender(WEBHOOK_CONCURRENCY, WEBHOOK_MAX_ATTEMPTS)
+        self.pauses: PauseSweeper = PauseSweeper(self.database, PAUSE_RESYNC_INTERVAL)
+
+        self.delivery: DeliveryEngine = DeliveryEngine(
+            self, DELIVERY_WINDOW, DELIVERY_REFRESH_INTERVAL, DELIVERY_CONCURRENCY, DELIVERY_PAUSE_RECHECK,
+            DELIVERY_WHEEL_SLOTS, DELIVERY_MAX_LOADED, DELIVERY_RESCHEDULE_INTERVAL,
+            (index, self.config.delivery_workers), worker_name(), DELIVERY_LEASE,
+            self.config.catchup_rate, self.config.catchup_channel_cap, DELIVERY_CATCHUP_THRESHOLD,
+            DELIVERY_CATCHUP_WINDOW, self.config.catchup_collapse)
+
+        self.stopping: asyncio.Event = asyncio.Event()
+
+    async def serve(self):
+        # only the REST API is needed, for channels without a webhook
+        await self.login(self.config.token)
+
+        self.c_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_CONNECTIONS, keepalive_timeout=HTTP_KEEPALIVE))
+
+        self.webhooks.start(self.c_session)
+        self.pauses.start(self.loop)
+        self.delivery.start(self.loop)
+
+        print('Delivering partition {} of {} as {}'.format(
+            self.delivery.partition[0], self.delivery.partition[1], self.delivery.worker))
+
+        try:
+            await self.stopping.wait()
+
+        finally:
+            await self.close()
+
+    async def close(self):
+        self.delivery.stop()
+        self.pauses.stop()
+
+        if self.c_session is not None:
+            await self.c_session.close()
+
+        await super(DeliveryWorker, self).close()
+
+        self.database.shutdown()
+
+        print('Delivery: {}, lost {} claims to other workers'.format(self.delivery.stats(), self.delivery.lost_claims))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deliver one partition of the reminders.')
+    parser.add_argument('index', type=int, help='the partition to deliver, from 0 to delivery_workers - 1')
+    args = parser.parse_args()
+
+    worker = DeliveryWorker(args.index)
+
+    if not 0 <= args.index < worker.config.delivery_workers:
+        parser.error('index must be below delivery_workers ({})'.format(worker.config.delivery_workers))
+
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        worker.loop.add_signal_handler(stop_signal, worker.stopping.set)
+
+    worker.loop.run_until_complete(worker.serve())
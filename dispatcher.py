@@ -0,0 +1,72 @@
+import re
+import typing
+
+# a command word, then either nothing or whitespace and the arguments
+COMMAND_PATTERN = re.compile(r'(\S+)(?:\s+(.*))?', re.DOTALL)
+
+
+class CommandMatch(typing.NamedTuple):
+    prefix: typing.Optional[str]  # None if the bot was mentioned instead
+    command: str
+    args: str
+
+
+class Dispatcher:
+    def __init__(self, command_names: typing.Iterable[str]):
+        self.command_names: typing.FrozenSet[str] = frozenset(command_names)
+
+        self._mention: typing.Optional[typing.Pattern] = None
+
+        self._prefixes: typing.Set[str] = set()
+        self._prefix_lengths: typing.Tuple[int, ...] = ()
+        self._first_characters: typing.Set[str] = set()
+
+    @property
+    def ready(self) -> bool:
+        return self._mention is not None
+
+    def compile(self, user_id: int, prefixes: typing.Iterable[str]):
+        self._mention = re.compile(r'<@!?{}>\s+'.format(user_id))
+
+        self._prefixes = {'$'}
+        self.add_prefixes(prefixes)
+
+    def add_prefixes(self, prefixes: typing.Iterable[str]):
+        self._prefixes.update(p for p in prefixes if p)
+
+        self._prefix_lengths = tuple(sorted({len(p) for p in self._prefixes}))
+        self._first_characters = {p[0] for p in self._prefixes} | {'<'}
+
+    def could_be_command(self, content: str) -> bool:
+        # runs on every guild message, so avoid anything more than a few set lookups
+        if content[:1] not in self._first_characters:
+            return False
+
+        elif content.startswith('<@'):
+            return True
+
+        else:
+            return any(content[:length] in self._prefixes for length in self._prefix_lengths)
+
+    def resolve(self, content: str, prefix: str) -> typing.Optional[CommandMatch]:
+        if (mention := self._mention.match(content)) is not None:
+            used_prefix = None
+            remainder = content[mention.end():]
+
+        elif content.startswith(prefix):
+            used_prefix = prefix
+            remainder = content[len(prefix):]
+
+        else:
+            return None
+
+        if (match := COMMAND_PATTERN.fullmatch(remainder)) is None:
+            return None
+
+        command = match.group(1).lower()
+
+        if command in self.command_names:
+            return CommandMatch(used_prefix, command, match.group(2) or '')
+
+        else:
+            return None
@@ -0,0 +1,157 @@
+import re
+import typing
+from functools import lru_cache
+
+MINUTE: int = 60
+HOUR: int = 3600
+DAY: int = 86400
+WEEK: int = 604800
+# fixed lengths, so an interval doesn't depend on the month or year it was set in
+MONTH: int = 2592000
+YEAR: int = 31536000
+
+FALLBACK_LANGUAGE: str = 'EN'
+
+# language code -> word -> seconds
+UNITS: typing.Dict[str, typing.Dict[str, int]] = {
+    'EN': {
+        's': 1, 'sec': 1, 'secs': 1, 'second': 1, 'seconds': 1,
+        'm': MINUTE, 'min': MINUTE, 'mins': MINUTE, 'minute': MINUTE, 'minutes': MINUTE,
+        'h': HOUR, 'hr': HOUR, 'hrs': HOUR, 'hour': HOUR, 'hours': HOUR,
+        'd': DAY, 'day': DAY, 'days': DAY,
+        'w': WEEK, 'week': WEEK, 'weeks': WEEK, 'fortnight': 2 * WEEK, 'fortnights': 2 * WEEK,
+        'month': MONTH, 'months': MONTH,
+        'y': YEAR, 'yr': YEAR, 'yrs': YEAR, 'year': YEAR, 'years': YEAR,
+    },
+    'DE': {
+        'sekunde': 1, 'sekunden': 1,
+        'minute': MINUTE, 'minuten': MINUTE,
+        'stunde': HOUR, 'stunden': HOUR, 'std': HOUR,
+        'tag': DAY, 'tage': DAY, 'tagen': DAY,
+        'woche': WEEK, 'wochen': WEEK,
+        'monat': MONTH, 'monate': MONTH, 'monaten': MONTH,
+        'jahr': YEAR, 'jahre': YEAR, 'jahren': YEAR,
+    },
+    'ES': {
+        'segundo': 1, 'segundos': 1,
+        'minuto': MINUTE, 'minutos': MINUTE,
+        'hora': HOUR, 'horas': HOUR,
+        'día': DAY, 'días': DAY, 'dia': DAY, 'dias': DAY,
+        'semana': WEEK, 'semanas': WEEK,
+        'mes': MONTH, 'meses': MONTH,
+        'año': YEAR, 'años': YEAR,
+    },
+    'FR': {
+        'seconde': 1, 'secondes': 1,
+        'minute': MINUTE, 'minutes': MINUTE,
+        'heure': HOUR, 'heures': HOUR,
+        'jour': DAY, 'jours': DAY,
+        'semaine': WEEK, 'semaines': WEEK,
+        'mois': MONTH,
+        'an': YEAR, 'ans': YEAR, 'année': YEAR, 'années': YEAR,
+    },
+    'NL': {
+        'seconde': 1, 'seconden': 1,
+        'minuut': MINUTE, 'minuten': MINUTE,
+        'uur': HOUR, 'uren': HOUR,
+        'dag': DAY, 'dagen': DAY,
+        'week': WEEK, 'weken': WEEK,
+        'maand': MONTH, 'maanden': MONTH,
+        'jaar': YEAR, 'jaren': YEAR,
+    },
+}
+
+# language code -> word -> amount
+NUMBERS: typing.Dict[str, typing.Dict[str, int]] = {
+    'EN': {
+        'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+        'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12,
+    },
+    'DE': {'ein': 1, 'eine': 1, 'einen': 1, 'zwei': 2, 'drei': 3, 'vier': 4, 'fünf': 5, 'zehn': 10},
+    'ES': {'un': 1, 'una': 1, 'uno': 1, 'dos': 2, 'tres': 3, 'cuatro': 4, 'cinco': 5, 'diez': 10},
+    'FR': {'un': 1, 'une': 1, 'deux': 2, 'trois': 3, 'quatre': 4, 'cinq': 5, 'dix': 10},
+    'NL': {'een': 1, 'één': 1, 'twee': 2, 'drie': 3, 'vier': 4, 'vijf': 5, 'tien': 10},
+}
+
+# language code -> words allowed between two parts of a duration
+CONNECTORS: typing.Dict[str, typing.FrozenSet[str]] = {
+    'EN': frozenset({'and'}),
+    'DE': frozenset({'und'}),
+    'ES': frozenset({'y'}),
+    'FR': frozenset({'et'}),
+    'NL': frozenset({'en'}),
+}
+
+# numbers and words are split apart, so "2h30m" tokenizes the same as "2 h 30 m"; anything else is a separator
+TOKEN_PATTERN = re.compile(r'(\d+(?:\.\d+)?)|([^\W\d_]+)')
+
+
+class Grammar(typing.NamedTuple):
+    units: typing.Dict[str, int]
+    numbers: typing.Dict[str, int]
+    connectors: typing.FrozenSet[str]
+
+
+@lru_cache(maxsize=None)
+def grammar(language: typing.Optional[str]) -> Grammar:
+    # English is always understood, but never in place of a language's own words, e.g. "y" is "and" in Spanish
+    # rather than the English abbreviation for a year
+    language = (language or FALLBACK_LANGUAGE).upper()
+
+    own_units = UNITS.get(language, {})
+    own_numbers = NUMBERS.get(language, {})
+    own_connectors = CONNECTORS.get(language, frozenset())
+
+    # English numbers may also be the language's units, e.g. "an" in French. they're told apart by what follows them
+    return Grammar(
+        units={**{word: seconds for word, seconds in UNITS[FALLBACK_LANGUAGE].items()
+                  if word not in own_numbers and word not in own_connectors}, **own_units},
+        numbers={**{word: amount for word, amount in NUMBERS[FALLBACK_LANGUAGE].items()
+                    if word not in own_connectors}, **own_numbers},
+        connectors=own_connectors | frozenset(
+            word for word in CONNECTORS[FALLBACK_LANGUAGE] if word not in own_units and word not in own_numbers))
+
+
+@lru_cache(maxsize=4096)
+def parse_duration(text: str, language: typing.Optional[str] = None) -> typing.Optional[int]:
+    # a duration is one or more "[amount] unit" terms, where a missing amount means one, e.g "2 hours and 30 min"
+    rules = grammar(language)
+    tokens = TOKEN_PATTERN.findall(text.lower())
+
+    seconds = 0
+    amount = None
+    terms = 0
+
+    for position, (number, word) in enumerate(tokens):
+        if number:
+            if amount is not None:
+                return None
+
+            amount = float(number)
+
+        elif word in rules.connectors and amount is None and terms > 0:
+            continue
+
+        elif word in rules.units and not (
+                word in rules.numbers and amount is None and _unit_follows(rules, tokens, position)):
+            seconds += (1 if amount is None else amount) * rules.units[word]
+            amount = None
+            terms += 1
+
+        elif word in rules.numbers and amount is None:
+            amount = rules.numbers[word]
+
+        else:
+            return None
+
+    if amount is not None or terms == 0:
+        return None
+
+    return int(round(seconds))
+
+
+def _unit_follows(rules: Grammar, tokens: typing.List[typing.Tuple[str, str]], position: int) -> bool:
+    # whether a word that's both a number and a unit is followed by a unit, so is the amount of it: "an hour" is an
+    # hour in French too, though "an" alone is a year
+    return position + 1 < len(tokens) and tokens[position + 1][1] in rules.units
+
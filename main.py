@@ -1,25 +1,36 @@
 import asyncio
 import concurrent.futures
-import itertools
 import re
+import signal
 from datetime import datetime, timedelta
-from functools import partial
 from json import dumps as json_dump
 from time import time as unix_time
 from contextlib import contextmanager
+from contextvars import ContextVar
 
 import aiohttp
-import dateparser
-import pytz
 
+from batching import BatchInserter
+from caches import LRUCache, GuildSettings, UserIdentity, ChannelRecord
+import database
 from config import Config
+from delivery import DeliveryEngine, worker_name
+from dispatcher import Dispatcher
+from durations import parse_duration
+from natural import NaturalParser, ParserPool
+import timezones
 from consts import *
-from models import Reminder, Todo, Timer, Message, Channel, Event, CommandAlias, Session
+from models import Timer, Channel, CommandAlias, CommandRestriction, Event, Role, session_factory, STRINGS, engine, guild_users
 from passers import *
+from pauses import PauseSweeper
 from time_extractor import TimeExtractor, InvalidTime
+from webhooks import WebhookSender
 
 THEME_COLOR = 0x8fb677
 
+# each event handler runs in its own task, so this gives every in-flight command a session of its own
+current_session: ContextVar[typing.Optional[sqlalchemy.orm.session.Session]] = ContextVar('session', default=None)
+
 
 class BotClient(discord.AutoShardedClient):
     def __init__(self, *args, **kwargs):
@@ -64,10 +75,9 @@ class BotClient(discord.AutoShardedClient):
             'pause': Command('pause', self.pause_channel, False, PermissionLevels.RESTRICTED),
         }
 
-        self.match_string = None
-
         self.command_names = set(self.commands.keys())
-        self.joined_names = '|'.join(self.command_names)
+        self.dispatcher: Dispatcher = Dispatcher(self.command_names)
+        self.prefix_refresher: typing.Optional[asyncio.Task] = None
 
         # used in restrict command for filtration
         self.max_command_length = max(len(x) for x in self.command_names)
@@ -75,27 +85,72 @@ class BotClient(discord.AutoShardedClient):
         self.config: Config = Config(filename='config.ini')
 
         self.executor: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor()
+        self.natural_parser: NaturalParser = NaturalParser(NATURAL_CACHE_SIZE)
+
+        self.parser_pool: typing.Optional[ParserPool] = None
+        if self.config.parse_workers > 0:
+            self.parser_pool = ParserPool(
+                self.config.parse_workers, self.config.parse_max_in_flight, self.config.parse_timeout)
         self.c_session: typing.Optional[aiohttp.ClientSession] = None
 
-        self.session: sqlalchemy.orm.session.Session = None
+        self.database: database.Database = database.Database(DATABASE_WORKERS)
+
+        # discord guild id -> GuildSettings, so prefix checks don't need the database
+        self.guild_cache: LRUCache = LRUCache(GUILD_CACHE_SIZE, GUILD_CACHE_TTL)
+        # discord user id -> UserIdentity, shared by everything that needs to resolve a user
+        self.user_cache: LRUCache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+        # discord channel id -> ChannelRecord, so blacklist and webhook checks don't need the database
+        self.channel_cache: LRUCache = LRUCache(CHANNEL_CACHE_SIZE, CHANNEL_CACHE_TTL)
+
+        self.restrictions: RestrictionIndex = RestrictionIndex()
+
+        # (guild id, user id) pairs known to be in guild_users. new pairs are inserted in the background
+        self.guild_members: typing.Set[typing.Tuple[int, int]] = set()
+        self.membership_writer: BatchInserter = BatchInserter(
+            engine, guild_users, MEMBERSHIP_FLUSH_INTERVAL, MEMBERSHIP_BATCH_SIZE, ignore_duplicates=True)
+        # audit events are written behind the command, so logging them never delays a reply
+        self.audit_writer: BatchInserter = BatchInserter(
+            engine, Event.__table__, AUDIT_FLUSH_INTERVAL, AUDIT_BATCH_SIZE, max_pending=AUDIT_MAX_PENDING)
+
+        self.webhooks: WebhookSender = WebhookSender(WEBHOOK_CONCURRENCY, WEBHOOK_MAX_ATTEMPTS)
+        # channels that are paused, and clears their pauses as they run out
+        self.pauses: PauseSweeper = PauseSweeper(self.database, PAUSE_RESYNC_INTERVAL, self.channel_cache)
+
+        self.delivery: typing.Optional[DeliveryEngine] = None
+        if self.config.delivery_engine:
+            self.delivery = DeliveryEngine(
+                self, DELIVERY_WINDOW, DELIVERY_REFRESH_INTERVAL, DELIVERY_CONCURRENCY, DELIVERY_PAUSE_RECHECK,
+                DELIVERY_WHEEL_SLOTS, DELIVERY_MAX_LOADED, DELIVERY_RESCHEDULE_INTERVAL,
+                (self.config.delivery_worker, self.config.delivery_workers), worker_name(), DELIVERY_LEASE,
+                self.config.catchup_rate, self.config.catchup_channel_cap, DELIVERY_CATCHUP_THRESHOLD,
+                DELIVERY_CATCHUP_WINDOW, self.config.catchup_collapse)
 
         super(BotClient, self).__init__(*args, **kwargs)
 
 
+    @property
+    def session(self) -> typing.Optional[sqlalchemy.orm.session.Session]:
+        return current_session.get()
+
     @contextmanager
     def get_session(self):
-        session_already_exists = self.session is not None
+        session = current_session.get()
+        session_already_exists = session is not None
+
         if not session_already_exists:
-            self.session = Session()
+            session = session_factory()
+            token = current_session.set(session)
+
         try:
-            yield self.session
+            yield session
         except:
-            self.session.rollback()
+            session.rollback()
             raise
         finally:
             if not session_already_exists:
-                Session.remove()
-                self.session = None
+                session.close()
+                current_session.reset(token)
 
 
     async def do_blocking(self, method):
@@ -103,24 +158,90 @@ class BotClient(discord.AutoShardedClient):
         a, _ = await asyncio.wait([self.loop.run_in_executor(self.executor, method)])
         return [x.result() for x in a][0]
 
+    async def get_guild_settings(self, guild_id: int) -> GuildSettings:
+        settings: typing.Optional[GuildSettings] = self.guild_cache.get(guild_id)
+
+        if settings is None:
+            settings = await self.database.run(database.load_guild_settings, guild_id)
+            self.guild_cache.set(guild_id, settings)
+
+            self.dispatcher.add_prefixes((settings.prefix,))
+
+        return settings
+
+    async def get_channel_record(self, discord_channel: discord.TextChannel,
+                                 guild_id: typing.Optional[int] = None) -> ChannelRecord:
+        record: typing.Optional[ChannelRecord] = self.channel_cache.get(discord_channel.id)
+
+        if record is None or not record.webhook or record.name != discord_channel.name or \
+                (record.guild_id is None and guild_id is not None):
+            record, _ = await self.database.run(database.load_channel, discord_channel, guild_id)
+
+            if not record.webhook:
+                hook = await discord_channel.create_webhook(name='Reminders')
+
+                record = await self.database.run(database.store_webhook, record.id, hook.id, hook.token)
+
+            self.channel_cache.set(discord_channel.id, record)
+
+        return record
+
+    def cache_user(self, user: User) -> UserIdentity:
+        identity = database.user_identity(user)
+        self.user_cache.set(user.user, identity)
+
+        return identity
+
+    def update_cached_user(self, member_id: int, **changes):
+        # write-through for settings changed by commands, so the cache doesn't need invalidating
+        if (identity := self.user_cache.get(member_id)) is not None:
+            self.user_cache.set(member_id, identity._replace(**changes))
+
+    def log_event(self, event_name: str, guild_id: int, user_id: int, bulk_count: typing.Optional[int] = None,
+                  reminder_id: typing.Optional[int] = None):
+        self.audit_writer.add({
+            'time': datetime.now(),
+            'event_name': event_name,
+            'bulk_count': bulk_count,
+            'guild_id': guild_id,
+            'user_id': user_id,
+            'reminder_id': reminder_id,
+        })
+
+    def remember_membership(self, guild_id: int, user_id: int):
+        if (guild_id, user_id) not in self.guild_members:
+            if len(self.guild_members) >= MEMBERSHIP_CACHE_SIZE:
+                # inserts are idempotent, so forgetting pairs only costs a redundant write
+                self.guild_members.clear()
+
+            self.guild_members.add((guild_id, user_id))
+            self.membership_writer.add({'guild': guild_id, 'user': user_id})
+
     async def find_and_create_member(self, member_id: int, context_guild: typing.Optional[discord.Guild]) \
-            -> typing.Optional[User]:
-        u: User = self.session.query(User).filter(User.user == member_id).first()
+            -> typing.Optional[UserIdentity]:
+        if (identity := self.user_cache.get(member_id)) is not None:
+            return identity
+
+        identity = await self.database.run(database.load_user, member_id)
 
-        if u is None and context_guild is not None:
+        if identity is None and context_guild is not None:
             m = context_guild.get_member(member_id) or self.get_user(member_id)
 
             if m is not None:
-                c = Channel(channel=(await m.create_dm()).id)
-                self.session.add(c)
-                self.session.flush()
+                dm_channel = await m.create_dm()
 
-                u = User(user=m.id, name='{}'.format(m), dm_channel=c.id)
+                identity = await self.database.run(database.create_user, m.id, '{}'.format(m), dm_channel.id)
 
-                self.session.add(u)
-                self.session.commit()
+        if identity is not None:
+            self.user_cache.set(member_id, identity)
+
+        return identity
+
+    def reload_strings(self):
+        # called after languages/to_database.py has been re-run against a live bot
+        STRINGS.load(engine)
 
-        return u
+        print('Reloaded language strings')
 
     async def is_patron(self, member_id) -> bool:
         if self.config.patreon_enabled:
@@ -168,11 +289,31 @@ class BotClient(discord.AutoShardedClient):
         print(self.user.name)
         print(self.user.id)
 
-        self.match_string = \
-            r'(?:(?:<@ID>\s+)|(?:<@!ID>\s+)|(?P<prefix>\S{1,5}?))(?P<cmd>COMMANDS)(?:$|\s+(?P<args>.*))' \
-                .replace('ID', str(self.user.id)).replace('COMMANDS', self.joined_names)
+        with self.get_session() as session:
+            self.dispatcher.compile(self.user.id, (p for p, in session.query(Guild.prefix).distinct()))
+
+        self.membership_writer.start(self.loop, self.executor)
+        self.audit_writer.start(self.loop, self.executor)
+
+        if self.prefix_refresher is None:
+            self.prefix_refresher = self.loop.create_task(self.refresh_prefixes())
+
+        if self.c_session is None:
+            # one pool of kept-alive connections, shared by webhook deliveries and the other HTTP calls
+            self.c_session: aiohttp.client.ClientSession = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=HTTP_CONNECTIONS, keepalive_timeout=HTTP_KEEPALIVE))
 
-        self.c_session: aiohttp.client.ClientSession = aiohttp.ClientSession()
+        self.webhooks.start(self.c_session)
+        self.pauses.start(self.loop)
+
+        if self.delivery is not None:
+            self.delivery.start(self.loop)
+
+        try:
+            self.loop.add_signal_handler(signal.SIGHUP, self.reload_strings)
+        except (NotImplementedError, AttributeError):
+            # no SIGHUP on this platform; strings will only be loaded on startup
+            pass
 
         if self.config.patreon_enabled:
             print('Patreon is enabled. Will look for servers {}'.format(self.config.patreon_server))
@@ -180,6 +321,30 @@ class BotClient(discord.AutoShardedClient):
         print('Local timezone set to *{}*'.format(self.config.local_timezone))
         print('Local language set to *{}*'.format(self.config.local_language))
 
+    async def refresh_prefixes(self):
+        # pick up prefixes that were changed outside of the bot, e.g. from the dashboard
+        while not self.is_closed():
+            await asyncio.sleep(GUILD_CACHE_TTL)
+
+            with self.get_session() as session:
+                self.dispatcher.add_prefixes(p for p, in session.query(Guild.prefix).distinct())
+
+    async def close(self):
+        if self.delivery is not None:
+            self.delivery.stop()
+
+        self.pauses.stop()
+
+        await self.membership_writer.close()
+        await self.audit_writer.close()
+
+        await super(BotClient, self).close()
+
+        self.database.shutdown()
+
+        if self.parser_pool is not None:
+            self.parser_pool.shutdown()
+
     async def on_guild_join(self, guild):
         await self.send()
 
@@ -187,11 +352,19 @@ class BotClient(discord.AutoShardedClient):
 
     # noinspection PyMethodMayBeStatic
     async def on_guild_remove(self, guild):
-        self.session.query(Guild).filter(Guild.guild == guild.id).delete(synchronize_session='fetch')
+        with self.get_session() as session:
+            session.query(Guild).filter(Guild.guild == guild.id).delete(synchronize_session=False)
+            session.commit()
+
+        self.guild_cache.invalidate(guild.id)
 
     # noinspection PyMethodMayBeStatic
     async def on_guild_channel_delete(self, channel):
-        self.session.query(Channel).filter(Channel.channel == channel.id).delete(synchronize_session='fetch')
+        with self.get_session() as session:
+            session.query(Channel).filter(Channel.channel == channel.id).delete(synchronize_session=False)
+            session.commit()
+
+        self.channel_cache.invalidate(channel.id)
 
     async def send(self):
         if self.config.dbl_token:
@@ -219,29 +392,25 @@ class BotClient(discord.AutoShardedClient):
             return p.send_messages and p.embed_links
 
         async def _get_user(_message):
-            _user = self.session.query(User).filter(User.user == message.author.id).first()
-            if _user is None:
-                dm_channel_id = (await message.author.create_dm()).id
+            _user = await self.database.run(database.load_user_row, _message.author.id)
 
-                c = self.session.query(Channel).filter(Channel.channel == dm_channel_id).first()
+            if _user is None:
+                dm_channel_id = (await _message.author.create_dm()).id
 
-                if c is None:
-                    c = Channel(channel=dm_channel_id)
-                    self.session.add(c)
-                    self.session.flush()
+                await self.database.run(database.create_user, _message.author.id, '{}#{}'.format(
+                    _message.author.name, _message.author.discriminator), dm_channel_id)
+                _user = await self.database.run(database.load_user_row, _message.author.id)
 
-                    _user = User(user=_message.author.id, dm_channel=c.id, name='{}#{}'.format(
-                        _message.author.name, _message.author.discriminator))
-                    self.session.add(_user)
-                    self.session.flush()
+            self.cache_user(_user)
 
-            return _user
+            # into this command's session, without querying again, so commands can change it
+            return self.session.merge(_user, load=False)
 
         if (message.author.bot and self.config.ignore_bots) or \
                 message.content is None or \
                 message.tts or \
                 len(message.attachments) > 0 or \
-                self.match_string is None:
+                not self.dispatcher.ready:
 
             # either a bot or cannot be a command
             return
@@ -268,48 +437,41 @@ class BotClient(discord.AutoShardedClient):
                             await command.func(message, args, Preferences(None, user, session))
 
         elif _check_self_permissions(message.channel):
+            # cheap check that the message starts with some guild's prefix or a mention
+            if not self.dispatcher.could_be_command(message.content):
+                return
+
             with self.get_session() as session:
                 # command sent in guild. check for prefix & call
-                match = re.match(
-                    self.match_string,
-                    message.content,
-                    re.MULTILINE | re.DOTALL | re.IGNORECASE
-                )
+                guild_settings = await self.get_guild_settings(message.guild.id)
+
+                # prefix is none if a mention has been provided instead
+                if (match := self.dispatcher.resolve(message.content, guild_settings.prefix)) is not None:
+                    prefix = match.prefix
+                    guild = await self.database.run(database.load_guild_row, guild_settings.id)
 
-                if match is None:
-                    return
-                else:
-                    # matched command structure; now query for guild to compare prefix
-                    guild = session.query(Guild).filter(Guild.guild == message.guild.id).first()
                     if guild is None:
-                        guild = Guild(guild=message.guild.id)
+                        # cached settings outlived the row; refresh them
+                        self.guild_cache.invalidate(message.guild.id)
+                        guild = await self.database.run(
+                            database.load_guild_row, (await self.get_guild_settings(message.guild.id)).id)
 
-                        session.add(guild)
-                        session.flush()
+                    guild = session.merge(guild, load=False)
 
-                # if none, suggests mention has been provided instead since pattern still matched
-                if (prefix := match.group('prefix')) in (guild.prefix, None):
                     # prefix matched, might as well get the user now since this is a very small subset of messages
                     user = await _get_user(message)
 
-                    if guild not in user.guilds:
-                        guild.users.append(user)
+                    self.remember_membership(guild.id, user.id)
 
                     # create the nice info manager
                     info = Preferences(guild, user, session)
 
-                    command_word = match.group('cmd').lower()
-                    stripped = match.group('args') or ''
-                    command = self.commands[command_word]
+                    command = self.commands[match.command]
+                    stripped = match.args
 
                     # some commands dont get blacklisted e.g help, blacklist
                     if command.blacklists:
-                        channel, just_created = Channel.get_or_create(session, message.channel)
-
-                        if channel.guild_id is None:
-                            channel.guild_id = guild.id
-
-                        await channel.attach_webhook(message.channel)
+                        channel = await self.get_channel_record(message.channel, guild.id)
 
                         if channel.blacklisted:
                             await message.channel.send(
@@ -317,7 +479,9 @@ class BotClient(discord.AutoShardedClient):
                             return
 
                     # blacklist checked; now do command permissions
-                    if command.check_permissions(message.author, guild):
+                    await self.restrictions.load(self.database, guild.id)
+
+                    if command.check_permissions(message.author, guild, self.restrictions):
                         if message.guild.me.guild_permissions.manage_webhooks:
                             await command.func(message, stripped, info)
                             session.commit()
@@ -328,7 +492,7 @@ class BotClient(discord.AutoShardedClient):
                     else:
                         await message.channel.send(
                             info.language.get_string(
-                                str(command.permission_level)).format(prefix=prefix))
+                                self.session, str(command.permission_level)).format(prefix=prefix))
 
         else:
             return
@@ -342,10 +506,14 @@ class BotClient(discord.AutoShardedClient):
 
         ping: float = m.created_at.timestamp() - message_ts
 
+        delivery: str = 'off' if self.delivery is None else self.delivery.stats()
+
         await m.edit(content='''
         Uptime: {}s
         Ping: {}ms
-        '''.format(round(uptime), round(ping * 1000)))
+        Guild cache: {}
+        Delivery: {}
+        '''.format(round(uptime), round(ping * 1000), self.guild_cache.stats(), delivery))
 
     async def help(self, message, _stripped, preferences):
         await message.channel.send(embed=discord.Embed(
@@ -380,6 +548,9 @@ class BotClient(discord.AutoShardedClient):
                 preferences.prefix = new
                 self.session.commit()
 
+                self.guild_cache.invalidate(message.guild.id)
+                self.dispatcher.add_prefixes((new,))
+
                 await message.channel.send(preferences.language.get_string(self.session, 'prefix/success').format(
                     prefix=preferences.prefix))
 
@@ -439,7 +610,7 @@ class BotClient(discord.AutoShardedClient):
                     if command_obj is None or command_obj.name == 'alias':
                         await message.channel.send(preferences.language.get_string(self.session, 'alias/invalid_command'))
 
-                    elif command_obj.check_permissions(message.author, preferences.guild):
+                    elif command_obj.check_permissions(message.author, preferences.guild, self.restrictions):
                         await command_obj.func(message, ' '.join(split[1:]), preferences)
 
                     else:
@@ -484,16 +655,21 @@ class BotClient(discord.AutoShardedClient):
                     prefix=preferences.prefix, timezone=preferences.timezone)))
 
         else:
-            if stripped not in pytz.all_timezones:
+            zone_name: typing.Optional[str] = timezones.resolve(stripped)
+
+            if zone_name is None:
                 await message.channel.send(
                     embed=discord.Embed(description=preferences.language.get_string(self.session, 'timezone/no_timezone')))
             else:
+                # near misses like "london" are stored as the zone they resolved to
+                stripped = zone_name
+
                 if admin:
                     preferences.server_timezone = stripped
                 else:
                     preferences.timezone = stripped
 
-                d = datetime.now(pytz.timezone(stripped))
+                d = datetime.now(timezones.get(stripped))
 
                 await message.channel.send(embed=discord.Embed(
                     description=preferences.language.get_string(self.session, s).format(
@@ -501,6 +677,11 @@ class BotClient(discord.AutoShardedClient):
 
                 self.session.commit()
 
+                if admin:
+                    self.guild_cache.invalidate(message.guild.id)
+                else:
+                    self.update_cached_user(message.author.id, timezone=stripped)
+
     async def set_language(self, message, stripped, preferences):
 
         new_lang = self.session.query(Language).filter(
@@ -510,6 +691,8 @@ class BotClient(discord.AutoShardedClient):
             preferences.language = new_lang.code
             self.session.commit()
 
+            self.update_cached_user(message.author.id, language=new_lang.code)
+
             await message.channel.send(embed=discord.Embed(description=new_lang.get_string(self.session, 'lang/set_p')))
 
         else:
@@ -528,7 +711,7 @@ class BotClient(discord.AutoShardedClient):
         else:
             f_string = '%H:%M:%S'
 
-        t = datetime.now(pytz.timezone(preferences.timezone))
+        t = datetime.now(timezones.get(preferences.timezone))
 
         await message.channel.send(preferences.language.get_string(self.session, 'clock/time').format(t.strftime(f_string)))
 
@@ -543,15 +726,10 @@ class BotClient(discord.AutoShardedClient):
 
         time_crop = stripped.split(server.language.get_string(self.session, 'natural/send'))[0]
         message_crop = stripped.split(server.language.get_string(self.session, 'natural/send'), 1)[1]
-        datetime_obj = await self.do_blocking(partial(dateparser.parse, time_crop, settings={
-            'TIMEZONE': server.timezone,
-            'TO_TIMEZONE': self.config.local_timezone,
-            'RELATIVE_BASE': datetime.now(pytz.timezone(server.timezone)).replace(tzinfo=None),
-            'PREFER_DATES_FROM': 'future'
-        }))
-        datetime_obj = pytz.timezone(self.config.local_timezone).localize(datetime_obj)
-
-        if datetime_obj is None:
+        mtime: typing.Optional[int] = await self.natural_parser.parse(
+            time_crop, server.timezone, server.language.code, self.do_blocking if self.parser_pool is None else self.parser_pool.run)
+
+        if mtime is None:
             await message.channel.send(
                 embed=discord.Embed(description=server.language.get_string(self.session, 'natural/invalid_time')))
             return
@@ -568,15 +746,15 @@ class BotClient(discord.AutoShardedClient):
         interval: int = 0
 
         if len(interval_split) > 1:
-            interval_dt = await self.do_blocking(partial(dateparser.parse, '1 ' + interval_split[-1]))
+            interval_length: typing.Optional[int] = parse_duration(interval_split[-1], server.language.code)
 
-            if interval_dt is None:
+            if interval_length is None:
                 pass
 
             elif await self.is_patron(message.author.id):
                 recurring = True
 
-                interval = abs((interval_dt - datetime.now()).total_seconds())
+                interval = interval_length
 
                 message_crop = message_crop.rsplit(server.language.get_string(self.session, 'natural/every'), 1)[0]
 
@@ -585,7 +763,6 @@ class BotClient(discord.AutoShardedClient):
                     description=server.language.get_string(self.session, 'interval/donor').format(prefix=server.prefix)))
                 return
 
-        mtime: int = int(datetime_obj.timestamp())
         responses: typing.List[ReminderInformation] = []
 
         for location_id in location_ids:
@@ -713,10 +890,10 @@ class BotClient(discord.AutoShardedClient):
             else:
                 return ReminderInformation(CreateReminderResponse.PAST_TIME)
 
-        channel: typing.Optional[Channel] = None
-        user: typing.Optional[User] = None
+        channel: typing.Optional[ChannelRecord] = None
+        user: typing.Optional[UserIdentity] = None
 
-        creator: User = User.from_discord(self.session, message.author)
+        creator: UserIdentity = await self.find_and_create_member(message.author.id, message.guild)
 
         # noinspection PyUnusedLocal
         discord_channel: typing.Optional[typing.Union[discord.TextChannel, DMChannelId]] = None
@@ -727,9 +904,7 @@ class BotClient(discord.AutoShardedClient):
 
             if discord_channel is not None:  # if not a DM reminder
 
-                channel, _ = Channel.get_or_create(self.session, discord_channel)
-
-                await channel.attach_webhook(discord_channel)
+                channel = await self.get_channel_record(discord_channel)
 
                 time += channel.nudge
 
@@ -743,7 +918,7 @@ class BotClient(discord.AutoShardedClient):
 
         # command fired in a DM; only possible target is the DM itself
         else:
-            user = User.from_discord(self.session, message.author)
+            user = creator
             discord_channel = DMChannelId(user.dm_channel, message.author.id)
 
         if interval is not None:
@@ -753,30 +928,12 @@ class BotClient(discord.AutoShardedClient):
             elif interval > MAX_TIME:
                 return ReminderInformation(CreateReminderResponse.LONG_INTERVAL)
 
-            else:
-                # noinspection PyArgumentList
-                reminder = Reminder(
-                    message=Message(content=text),
-                    channel=channel or user.channel,
-                    time=time,
-                    enabled=True,
-                    method=method,
-                    interval=interval,
-                    set_by=creator.id)
-                self.session.add(reminder)
-                self.session.commit()
+        channel_id: int = user.dm_channel if channel is None else channel.id
+        reminder_id: int = await self.database.run(
+            database.add_reminder, channel_id, text, time, interval, method, creator.id)
 
-        else:
-            # noinspection PyArgumentList
-            reminder = Reminder(
-                message=Message(content=text),
-                channel=channel or user.channel,
-                time=time,
-                enabled=True,
-                method=method,
-                set_by=creator.id)
-            self.session.add(reminder)
-            self.session.commit()
+        if self.delivery is not None:
+            self.delivery.push(reminder_id, time, channel_id)
 
         return ReminderInformation(CreateReminderResponse.OK, channel=discord_channel, time=time)
 
@@ -858,6 +1015,7 @@ class BotClient(discord.AutoShardedClient):
                 embed=discord.Embed(description=preferences.language.get_string(self.session, 'blacklist/removed')))
 
         self.session.commit()
+        self.channel_cache.invalidate(target_channel.id)
 
     async def restrict(self, message, stripped, preferences):
 
@@ -937,6 +1095,8 @@ class BotClient(discord.AutoShardedClient):
 
         self.session.commit()
 
+        self.restrictions.invalidate(preferences.guild.id)
+
     async def todo(self, message, stripped, preferences):
         await self.todo_command(message, stripped, preferences, 'todo')
 
@@ -944,24 +1104,25 @@ class BotClient(discord.AutoShardedClient):
         await self.todo_command(message, stripped, preferences, 'todos')
 
     async def todo_command(self, message, stripped, preferences, command):
+        user_id = preferences.user.id
+
         if command == 'todos':
-            location, _ = Channel.get_or_create(self.session, message.channel)
+            location, _ = await self.database.run(database.load_channel, message.channel, preferences.guild.id)
             name = 'Channel'
-            todos = location.todo_list.all() + preferences.guild.todo_list.filter(Todo.channel_id.is_(None)).all()
-            channel = location
-            guild = preferences.guild
+            channel_id = location.id
+            guild_id = preferences.guild.id
 
         else:
-            location = preferences.user
             name = 'Your'
-            todos = location.todo_list.filter(Todo.guild_id.is_(None)).all()
-            channel = None
-            guild = None
+            channel_id = None
+            guild_id = None
+
+        todos = await self.database.run(database.list_todos, user_id, guild_id, channel_id)
 
         splits = stripped.split(' ')
 
         if len(splits) == 1 and splits[0] == '':
-            msg = ['\n{}: {}'.format(i, todo.value) for i, todo in enumerate(todos, start=1)]
+            msg = ['\n{}: {}'.format(i, value) for i, (_, value) in enumerate(todos, start=1)]
             if len(msg) == 0:
                 msg.append(preferences.language.get_string(self.session, 'todo/add').format(
                     prefix=preferences.prefix, command=command))
@@ -981,17 +1142,15 @@ class BotClient(discord.AutoShardedClient):
             if splits[0] == 'add':
                 s = ' '.join(splits[1:])
 
-                todo = Todo(value=s, guild=guild, user=preferences.user, channel=channel)
-                self.session.add(todo)
+                await self.database.run(database.add_todo, s, user_id, guild_id, channel_id)
                 await message.channel.send(preferences.language.get_string(self.session, 'todo/added').format(name=s))
 
             elif splits[0] == 'remove':
                 try:
-                    todo = self.session.query(Todo).filter(Todo.id == todos[int(splits[1]) - 1].id).first()
-                    self.session.query(Todo).filter(Todo.id == todos[int(splits[1]) - 1].id).delete(
-                        synchronize_session='fetch')
+                    todo_id, value = todos[int(splits[1]) - 1]
+                    await self.database.run(database.delete_todos, (todo_id,))
 
-                    await message.channel.send(preferences.language.get_string(self.session, 'todo/removed').format(todo.value))
+                    await message.channel.send(preferences.language.get_string(self.session, 'todo/removed').format(value))
 
                 except ValueError:
                     await message.channel.send(
@@ -1007,34 +1166,31 @@ class BotClient(discord.AutoShardedClient):
 
         else:
             if stripped == 'clear':
-                todos.clear()
+                await self.database.run(database.delete_todos, [todo_id for todo_id, _ in todos])
                 await message.channel.send(preferences.language.get_string(self.session, 'todo/cleared'))
 
             else:
                 await message.channel.send(
                     preferences.language.get_string(self.session, 'todo/help').format(prefix=preferences.prefix, command=command))
 
-        self.session.commit()
-
     async def delete(self, message, _stripped, preferences):
-        if message.guild is not None:
-            channels = preferences.guild.channels
-            reminders = itertools.chain(*[c.reminders for c in channels])
+        guild_id = None if message.guild is None else preferences.guild.id
+        user_id = preferences.user.id
 
-        else:
-            reminders = preferences.user.channel.reminders
+        reminders = await self.database.run(
+            database.deletable_reminders, guild_id, preferences.user.dm_channel if guild_id is None else None)
 
         await message.channel.send(preferences.language.get_string(self.session, 'del/listing'))
 
         enumerated_reminders = [x for x in enumerate(reminders, start=1)]
 
         s = ''
-        for count, reminder in enumerated_reminders:
+        for count, (_, content, channel, time) in enumerated_reminders:
             string = '''**{}**: '{}' *{}* at {}\n'''.format(
                 count,
-                reminder.message_content(),
-                reminder.channel,
-                datetime.fromtimestamp(reminder.time, pytz.timezone(preferences.timezone)).strftime(
+                content,
+                channel,
+                datetime.fromtimestamp(time, timezones.get(preferences.timezone)).strftime(
                     '%Y-%m-%d %H:%M:%S'))
 
             if len(s) + len(string) > 2000:
@@ -1063,18 +1219,18 @@ class BotClient(discord.AutoShardedClient):
 
             removal_ids: typing.Set[int] = set()
 
-            for count, reminder in enumerated_reminders:
+            for count, (reminder_id, *_) in enumerated_reminders:
                 if count in nums:
-                    removal_ids.add(reminder.id)
+                    removal_ids.add(reminder_id)
                     nums.remove(count)
 
-            if message.guild is not None:
-                deletion_event = Event(
-                    event_name='delete', bulk_count=len(removal_ids), guild=preferences.guild, user=preferences.user)
-                self.session.add(deletion_event)
+            await self.database.run(database.delete_reminders, removal_ids)
 
-            self.session.query(Reminder).filter(Reminder.id.in_(removal_ids)).delete(synchronize_session='fetch')
-            self.session.commit()
+            if self.delivery is not None:
+                self.delivery.cancel(removal_ids)
+
+            if guild_id is not None:
+                self.log_event('delete', guild_id, user_id, bulk_count=len(removal_ids))
 
             await message.channel.send(preferences.language.get_string(self.session, 'del/count').format(len(removal_ids)))
 
@@ -1094,7 +1250,7 @@ class BotClient(discord.AutoShardedClient):
             return ', '.join(sections)
 
         def absolute_time(t):
-            return datetime.fromtimestamp(t, pytz.timezone(preferences.timezone)).strftime('%Y-%m-%d %H:%M:%S')
+            return datetime.fromtimestamp(t, timezones.get(preferences.timezone)).strftime('%Y-%m-%d %H:%M:%S')
 
         r = re.search(r'(\d+)', stripped)
 
@@ -1114,41 +1270,36 @@ class BotClient(discord.AutoShardedClient):
             time_func = relative_time
 
         if message.guild is None:
-            channel = preferences.user.channel
+            channel_id = preferences.user.dm_channel
             new = False
 
         else:
             discord_channel = message.channel_mentions[0] if len(message.channel_mentions) > 0 else message.channel
 
-            channel, new = Channel.get_or_create(self.session, discord_channel)
+            channel, new = await self.database.run(database.load_channel, discord_channel, preferences.guild.id)
+            channel_id = channel.id
 
         if new:
             await message.channel.send(preferences.language.get_string(self.session, 'look/no_reminders'))
 
         else:
-            reminder_query = channel.reminders.order_by(Reminder.time)
+            reminders = await self.database.run(database.channel_reminders, channel_id, not show_disabled, limit)
 
-            if not show_disabled:
-                reminder_query = reminder_query.filter(Reminder.enabled)
-
-            if limit is not None:
-                reminder_query = reminder_query.limit(limit)
-
-            if reminder_query.count() > 0:
+            if len(reminders) > 0:
                 if limit is not None:
                     await message.channel.send(preferences.language.get_string(self.session, 'look/listing_limited').format(
-                        reminder_query.count()))
+                        len(reminders)))
 
                 else:
                     await message.channel.send(preferences.language.get_string(self.session, 'look/listing'))
 
                 s = ''
-                for reminder in reminder_query:
+                for content, time, enabled in reminders:
                     string = '\'{}\' *{}* **{}** {}\n'.format(
-                        reminder.message_content(),
+                        content,
                         preferences.language.get_string(self.session, 'look/inter'),
-                        time_func(reminder.time),
-                        '' if reminder.enabled else '`disabled`')
+                        time_func(time),
+                        '' if enabled else '`disabled`')
 
                     if len(s) + len(string) > 2000:
                         await message.channel.send(s, allowed_mentions=NoMention)
@@ -1163,11 +1314,6 @@ class BotClient(discord.AutoShardedClient):
 
     async def offset_reminders(self, message, stripped, preferences):
 
-        if message.guild is None:
-            reminders = preferences.user.reminders
-        else:
-            reminders = itertools.chain(*[channel.reminders for channel in preferences.guild.channels])
-
         time_parser = TimeExtractor(stripped, preferences.timezone)
 
         try:
@@ -1183,17 +1329,16 @@ class BotClient(discord.AutoShardedClient):
                     description=preferences.language.get_string(self.session, 'offset/help').format(prefix=preferences.prefix)))
 
             else:
-                c = 0
-                for r in reminders:
-                    c += 1
-                    r.time += time
+                guild_id = None if message.guild is None else preferences.guild.id
 
-                if message.guild is not None:
-                    edit_event = Event(
-                        event_name='edit', bulk_count=c, guild=preferences.guild, user=preferences.user)
-                    self.session.add(edit_event)
+                count = await self.database.run(
+                    database.offset_reminders, time, guild_id, preferences.user.dm_channel if guild_id is None else None)
 
-                self.session.commit()
+                if guild_id is not None:
+                    self.log_event('edit', guild_id, preferences.user.id, bulk_count=count)
+
+                if self.delivery is not None:
+                    self.delivery.request_refresh()
 
                 await message.channel.send(
                     embed=discord.Embed(description=preferences.language.get_string(self.session, 'offset/success').format(time)))
@@ -1216,6 +1361,7 @@ class BotClient(discord.AutoShardedClient):
                 channel.nudge = t
 
                 self.session.commit()
+                self.channel_cache.invalidate(message.channel.id)
 
                 await message.channel.send(
                     embed=discord.Embed(description=preferences.language.get_string(self.session, 'nudge/success').format(t)))
@@ -1244,7 +1390,7 @@ class BotClient(discord.AutoShardedClient):
                 channel.paused_until = datetime.now() + timedelta(seconds=t)
 
                 display = channel.paused_until \
-                    .astimezone(pytz.timezone(preferences.timezone)) \
+                    .astimezone(timezones.get(preferences.timezone)) \
                     .strftime('%Y-%m-%d, %H:%M:%S')
 
                 await message.channel.send(
@@ -1263,6 +1409,16 @@ class BotClient(discord.AutoShardedClient):
                 await message.channel.send(
                     embed=discord.Embed(description=preferences.language.get_string(self.session, 'pause/unpaused')))
 
+        self.session.commit()
+        self.channel_cache.invalidate(message.channel.id)
+
+        if channel.paused:
+            self.pauses.pause(channel.id, None if channel.paused_until is None else channel.paused_until.timestamp())
+        else:
+            self.pauses.unpause(channel.id)
+
 
-client = BotClient(max_messages=100, guild_subscriptions=False, fetch_offline_members=False)
-client.run(client.config.token)
+if __name__ == '__main__':
+    # guarded, so parser processes that import this module don't start a bot of their own
+    client = BotClient(max_messages=100, guild_subscriptions=False, fetch_offline_members=False)
+    client.run(client.config.token)
@@ -0,0 +1,68 @@
+import sys
+import time
+
+from sqlalchemy import create_engine, text
+import configparser
+
+# checks that the hot queries use the indexes from alembic revision a7c21e5d9f04. run from the directory holding
+# config.ini after upgrading. on a near-empty table MySQL may rightly prefer a full scan, so check a populated database
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+user = config.get('MYSQL', 'USER')
+try:
+    passwd = config.get('MYSQL', 'PASSWD')
+except:
+    passwd = None
+host = config.get('MYSQL', 'HOST')
+database = config.get('MYSQL', 'DATABASE')
+
+if passwd:
+    engine = create_engine('mysql+pymysql://{user}:{passwd}@{host}/{db}?charset=utf8mb4'.format(user=user, passwd=passwd, host=host, db=database))
+else:
+    engine = create_engine('mysql+pymysql://{user}@{host}/{db}?charset=utf8mb4'.format(user=user, host=host, db=database))
+
+now = int(time.time())
+
+# description -> (query, parameters, index it should use)
+QUERIES = {
+    'due reminders': (
+        'SELECT id, time FROM reminders WHERE enabled = 1 AND time < :until ORDER BY time LIMIT 1000',
+        {'until': now + 3600},
+        'ix_reminders_enabled_time_channel'),
+    'channel reminders (look)': (
+        'SELECT id, time FROM reminders WHERE channel_id = :channel ORDER BY time',
+        {'channel': 1},
+        'ix_reminders_channel_time'),
+    'expired pauses': (
+        'SELECT id FROM channels WHERE paused_until <= NOW()',
+        {},
+        'ix_channels_paused_until'),
+    'personal todos': (
+        'SELECT id, value FROM todos WHERE user_id = :user AND guild_id IS NULL ORDER BY id',
+        {'user': 1},
+        'ix_todos_user_guild'),
+    'guild todos': (
+        'SELECT id, value FROM todos WHERE guild_id = :guild AND channel_id IS NULL ORDER BY id',
+        {'guild': 1},
+        'ix_todos_guild_channel'),
+}
+
+failures = 0
+
+with engine.connect() as connection:
+    for description, (query, parameters, index) in QUERIES.items():
+        plans = connection.execute(text('EXPLAIN ' + query), parameters).fetchall()
+        used = [plan['key'] for plan in plans]
+
+        if index in used:
+            print('OK    {}: uses {}'.format(description, index))
+
+        else:
+            failures += 1
+            print('FAIL  {}: expected {}, plan uses {}'.format(description, index, ', '.join(str(k) for k in used)))
+
+            for plan in plans:
+                print('      {}'.format(dict(plan)))
+
+sys.exit(1 if failures else 0)
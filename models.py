@@ -1,6 +1,6 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, Text, Boolean, Table, ForeignKey, UniqueConstraint
-from sqlalchemy import text
+from sqlalchemy import Column, Integer, String, Text, Boolean, Table, ForeignKey, UniqueConstraint, MetaData, Index
+from sqlalchemy import text, select
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, scoped_session, relationship, backref
 from sqlalchemy.dialects.mysql import BIGINT, MEDIUMINT, SMALLINT, INTEGER as INT, TIMESTAMP, ENUM
@@ -74,7 +74,7 @@ class Channel(Base):
     webhook_token = Column(Text)
 
     paused = Column(Boolean, nullable=False, default=False)
-    paused_until = Column(TIMESTAMP)
+    paused_until = Column(TIMESTAMP, index=True)
 
     guild_id = Column(INT(unsigned=True), ForeignKey(Guild.id, ondelete='CASCADE'))
     guild = relationship(Guild, backref='channels')
@@ -86,14 +86,18 @@ class Channel(Base):
         return '<#{}>'.format(self.channel)
 
     @classmethod
-    def get_or_create(cls, session, finding_channel) -> ('Channel', bool):
+    def get_or_create(cls, session, finding_channel, guild_id: typing.Optional[int] = None) -> ('Channel', bool):
         c = session.query(cls).filter(cls.channel == finding_channel.id).first()
         new = False
 
         if c is None:
-            g = session.query(Guild).filter(Guild.guild == finding_channel.guild.id).first()
+            if guild_id is None:
+                g = session.query(Guild).filter(Guild.guild == finding_channel.guild.id).first()
 
-            gid = None if g is None else g.id
+                gid = None if g is None else g.id
+
+            else:
+                gid = guild_id
 
             c = Channel(
                 channel=finding_channel.id,
@@ -102,12 +106,13 @@ class Channel(Base):
             )
 
             session.add(c)
+            session.flush()
             new = True
 
-        else:
+        elif c.name != finding_channel.name:
+            # only assign on change so an unchanged row isn't written back on commit
             c.name = finding_channel.name
 
-        session.flush()
         return c, new
 
     async def attach_webhook(self, channel):
@@ -222,6 +227,16 @@ class Reminder(Base):
     set_by = Column(INT(unsigned=True), ForeignKey(User.id, ondelete='SET NULL'), nullable=True)
     set_at = Column(TIMESTAMP, nullable=True, default=datetime.now, server_default=text('CURRENT_TIMESTAMP'))
 
+    # the delivery worker sending the reminder, and the unix time its claim runs out at
+    claimed_by = Column(String(64), nullable=True)
+    claimed_until = Column(INT(unsigned=True), nullable=True)
+
+    # created by alembic revision a7c21e5d9f04 on existing databases
+    __table_args__ = (
+        Index('ix_reminders_enabled_time_channel', 'enabled', 'time', 'channel_id'),
+        Index('ix_reminders_channel_time', 'channel_id', 'time'),
+    )
+
     @staticmethod
     def create_uid() -> str:
         full: str = ''
@@ -255,6 +270,11 @@ class Todo(Base):
 
     value = Column(String(2000), nullable=False)
 
+    __table_args__ = (
+        Index('ix_todos_user_guild', 'user_id', 'guild_id'),
+        Index('ix_todos_guild_channel', 'guild_id', 'channel_id'),
+    )
+
 
 User.todo_list = relationship(Todo, backref='user', lazy='dynamic')
 Guild.todo_list = relationship(Todo, backref='guild', lazy='dynamic')
@@ -297,11 +317,45 @@ class Language(Base):
     name = Column(String(20), nullable=False, unique=True)
     code = Column(String(2), nullable=False, unique=True)
 
-    def get_string(self, session, string):
-        s = session.query(Strings).filter(Strings.c.name == string)
-        req = getattr(s.first(), 'value_{}'.format(self.code))
+    def get_string(self, _session, string):
+        return STRINGS.get(self.code, string)
+
+
+class StringCatalog:
+    def __init__(self):
+        # language code -> string name -> value, with English fallbacks already filled in
+        self._strings: typing.Dict[str, typing.Dict[str, str]] = {}
+        self._languages: typing.Dict[str, Language] = {}
 
-        return req if req is not None else s.first().value_EN
+    def load(self, bind):
+        # reflect the table rather than using `Strings` so languages added since startup are picked up
+        table = Table('strings', MetaData(), autoload=True, autoload_with=bind)
+        codes = [c.name[len('value_'):] for c in table.columns if c.name.startswith('value_')]
+
+        strings: typing.Dict[str, typing.Dict[str, str]] = {code: {} for code in codes}
+
+        with bind.connect() as connection:
+            for row in connection.execute(select([table])):
+                fallback = row['value_EN']
+
+                for code in codes:
+                    value = row['value_{}'.format(code)]
+                    strings[code][row['name']] = fallback if value is None else value
+
+            languages = {
+                row['code']: Language(id=row['id'], name=row['name'], code=row['code'])
+                for row in connection.execute(select([Language.__table__]))
+            }
+
+        # swap in whole so readers never see a partially loaded catalog
+        self._strings = strings
+        self._languages = languages
+
+    def get(self, code, string):
+        return self._strings.get(code, self._strings['EN'])[string]
+
+    def language(self, code) -> typing.Optional[Language]:
+        return self._languages.get(code)
 
 
 class CommandRestriction(Base):
@@ -360,7 +414,9 @@ Strings = Table('strings', Base.metadata,
                 )
                 )
 
-ENGLISH_STRINGS: typing.Optional[Language] = session.query(Language) \
-    .filter(Language.code == config.get('DEFAULT', 'local_language')).first()
+STRINGS = StringCatalog()
+STRINGS.load(engine)
+
+ENGLISH_STRINGS: typing.Optional[Language] = STRINGS.language(config.get('DEFAULT', 'local_language'))
 
 Session.remove()
@@ -0,0 +1,299 @@
+import asyncio
+import concurrent.futures
+import os
+import re
+import typing
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from functools import lru_cache, partial
+
+import dateparser
+from dateparser.languages.loader import default_loader
+
+from caches import LRUCache
+from durations import parse_duration
+import timezones
+
+DAY_WORDS: typing.Dict[str, int] = {
+    'today': 0,
+    'tomorrow': 1,
+}
+
+FALLBACK_LANGUAGE: str = 'en'
+
+CLOCK_PATTERN = re.compile(r'(\d{1,2})(?::(\d{2}))?(?::(\d{2}))? ?(am|pm)?')
+
+# a parsed phrase that doesn't depend on when it was said:
+#   ('relative', seconds)
+#   ('days', days)
+#   ('clock', days or None for the next occurrence, hour, minute, second)
+Spec = typing.Tuple
+
+
+def normalize(phrase: str) -> str:
+    return ' '.join(phrase.lower().split())
+
+
+def _relative_spec(tokens: typing.List[str]) -> typing.Optional[Spec]:
+    if tokens and tokens[0] == 'in':
+        tokens = tokens[1:]
+
+    # the same grammar as intervals, so "in 2h30m" and "in 2 hours and 30 minutes" both work
+    seconds = parse_duration(' '.join(tokens), 'EN')
+
+    return None if not seconds else ('relative', seconds)
+
+
+def _clock_spec(tokens: typing.List[str]) -> typing.Optional[Spec]:
+    day = None
+
+    if tokens and tokens[0] in DAY_WORDS:
+        day = DAY_WORDS[tokens.pop(0)]
+
+    elif tokens and tokens[-1] in DAY_WORDS:
+        day = DAY_WORDS[tokens.pop()]
+
+    if tokens and tokens[0] == 'at':
+        tokens = tokens[1:]
+
+    if not tokens:
+        return None if day is None else ('days', day) if day > 0 else None
+
+    if (match := CLOCK_PATTERN.fullmatch(' '.join(tokens))) is None:
+        return None
+
+    hour, minute, second, meridian = match.groups()
+
+    # a bare number like "at 5" is ambiguous, so leave it to dateparser
+    if minute is None and meridian is None:
+        return None
+
+    hour, minute, second = int(hour), int(minute or 0), int(second or 0)
+
+    if meridian is not None:
+        if not 1 <= hour <= 12:
+            return None
+
+        hour = hour % 12 + (12 if meridian == 'pm' else 0)
+
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+
+    return 'clock', day, hour, minute, second
+
+
+@lru_cache(maxsize=4096)
+def fast_spec(normalized: str) -> typing.Optional[Spec]:
+    tokens = normalized.split(' ')
+
+    return _relative_spec(tokens) or _clock_spec(tokens)
+
+
+def evaluate(spec: Spec, base: datetime) -> float:
+    # relative phrases count elapsed time, as dateparser does, so they are unaffected by DST changes
+    if spec[0] == 'relative':
+        return base.timestamp() + spec[1]
+
+    elif spec[0] == 'days':
+        return base.timestamp() + spec[1] * 86400
+
+    # clock times are wall clock times in the base's timezone
+    else:
+        _, day, hour, minute, second = spec
+        naive_base = base.replace(tzinfo=None)
+        result = naive_base.replace(hour=hour, minute=minute, second=second, microsecond=0)
+
+        if day is None:
+            # like dateparser's PREFER_DATES_FROM future
+            if result <= naive_base:
+                result += timedelta(days=1)
+
+        else:
+            result += timedelta(days=day)
+
+        return base.tzinfo.localize(result).timestamp()
+
+
+@lru_cache(maxsize=None)
+def parse_languages(code: typing.Optional[str]) -> typing.Tuple[str, ...]:
+    # our codes are upper case, and dateparser raises on any code it has no data for
+    code = (code or FALLBACK_LANGUAGE).lower()
+
+    if code == FALLBACK_LANGUAGE or code not in default_loader.get_locale_map():
+        return FALLBACK_LANGUAGE,
+
+    else:
+        return code, FALLBACK_LANGUAGE
+
+
+def dateparse(phrase: str, timezone: str, base: datetime, languages: typing.Sequence[str] = (FALLBACK_LANGUAGE,)) \
+        -> typing.Optional[datetime]:
+    # without languages dateparser tries to detect the phrase's language across every locale it knows
+    return dateparser.parse(phrase, languages=list(languages), settings={
+        'TIMEZONE': timezone,
+        'TO_TIMEZONE': timezone,
+        'RELATIVE_BASE': base,
+        'PREFER_DATES_FROM': 'future',
+        'RETURN_AS_TIMEZONE_AWARE': False,
+    })
+
+
+def dateparse_twice(phrase: str, timezone: str, base: datetime, languages: typing.Sequence[str]) \
+        -> typing.Tuple[typing.Optional[datetime], typing.Optional[datetime]]:
+    # parsing against two bases a second apart shows whether the result moves with the base
+    return dateparse(phrase, timezone, base, languages), \
+        dateparse(phrase, timezone, base + timedelta(seconds=1), languages)
+
+
+def warm_up():
+    # loading dateparser's language data and compiling its patterns happens on first use, so do it up front
+    base = datetime.now()
+
+    for phrase in ('in 5 minutes', 'tomorrow at 3pm', 'next friday', '1st of january'):
+        dateparse(phrase, 'UTC', base)
+
+
+class ParserPool:
+    def __init__(self, workers: int, max_in_flight: int, timeout: float):
+        self.workers: int = workers
+        self.timeout: float = timeout
+        self.max_in_flight: int = max_in_flight
+
+        self._executor: concurrent.futures.ProcessPoolExecutor = self._start()
+        self._slots: typing.Optional[asyncio.Semaphore] = None
+
+    def _start(self) -> concurrent.futures.ProcessPoolExecutor:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+
+        # start every worker now so none of them warm up while a user is waiting
+        for _ in range(self.workers):
+            executor.submit(os.getpid)
+
+        return executor
+
+    async def run(self, method: typing.Callable):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+
+        # the timeout covers waiting for a slot too
+        return await asyncio.wait_for(self._run(method), self.timeout)
+
+    async def _run(self, method: typing.Callable):
+        # a worker that dies, e.g. killed for using too much memory, breaks the whole pool. replace it and try again,
+        # and if the new one breaks too, parse in this process rather than fail
+        for _ in range(2):
+            executor = self._executor
+
+            try:
+                return await self._submit(executor, method)
+
+            except BrokenProcessPool:
+                self._replace(executor)
+
+        return await asyncio.get_running_loop().run_in_executor(None, method)
+
+    def _replace(self, executor: concurrent.futures.ProcessPoolExecutor):
+        # parses that were in flight on it all fail together, so only the first of them replaces it
+        if self._executor is executor:
+            print('A parser process died; starting a new pool')
+
+            executor.shutdown(wait=False)
+            self._executor = self._start()
+
+    async def _submit(self, executor: concurrent.futures.ProcessPoolExecutor, method: typing.Callable):
+        loop = asyncio.get_running_loop()
+
+        await self._slots.acquire()
+
+        try:
+            future = executor.submit(method)
+        except:
+            self._slots.release()
+            raise
+
+        # a parse that times out is only abandoned here, and its worker keeps going. so it keeps its slot until it
+        # actually finishes, or is cancelled before it starts
+        future.add_done_callback(lambda _: self._release(loop))
+
+        return await asyncio.wrap_future(future)
+
+    def _release(self, loop: asyncio.AbstractEventLoop):
+        # called from the executor's thread
+        try:
+            loop.call_soon_threadsafe(self._slots.release)
+        except RuntimeError:
+            # the loop has closed, so the slots are no longer used
+            pass
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def cache_key(normalized: str, timezone: str, languages: typing.Tuple[str, ...], base: datetime) -> tuple:
+    return normalized, timezone, languages, base.replace(second=0, microsecond=0, tzinfo=None)
+
+
+class NaturalParser:
+    def __init__(self, cache_size: int):
+        # (phrase, timezone, languages, base to the minute) -> ('relative', seconds) or ('absolute', timestamp)
+        self.results: LRUCache = LRUCache(cache_size)
+        # (phrase, timezone, languages) that dateparser has parsed before. only these are worth the second parse that
+        # caching needs, so a phrase said once costs one parse
+        self.seen: LRUCache = LRUCache(cache_size)
+
+    def parse_fast(self, phrase: str, timezone: str, language: typing.Optional[str]) -> typing.Optional[int]:
+        normalized = normalize(phrase)
+        base = datetime.now(timezones.get(timezone))
+
+        if (spec := fast_spec(normalized)) is not None:
+            return int(evaluate(spec, base))
+
+        elif (cached := self.results.get(cache_key(normalized, timezone, parse_languages(language), base))) is not None:
+            kind, value = cached
+
+            return int(base.timestamp() + value if kind == 'relative' else value)
+
+        else:
+            return None
+
+    async def parse(self, phrase: str, timezone: str, language: typing.Optional[str],
+                    run_blocking: typing.Callable) -> typing.Optional[int]:
+        if (result := self.parse_fast(phrase, timezone, language)) is not None:
+            return result
+
+        normalized = normalize(phrase)
+        languages = parse_languages(language)
+        tz = timezones.get(timezone)
+        base = datetime.now(tz)
+
+        phrase_key = (normalized, timezone, languages)
+        repeated = self.seen.get(phrase_key) is not None
+
+        try:
+            if repeated:
+                first, second = await run_blocking(partial(
+                    dateparse_twice, normalized, timezone, base.replace(tzinfo=None), languages))
+
+            else:
+                first, second = await run_blocking(partial(
+                    dateparse, normalized, timezone, base.replace(tzinfo=None), languages)), None
+
+        except asyncio.TimeoutError:
+            return None
+
+        if first is None:
+            return None
+
+        self.seen.set(phrase_key, True)
+
+        timestamp = tz.localize(first).timestamp()
+        key = cache_key(normalized, timezone, languages, base)
+
+        # second is None for a phrase's first parse, which isn't cached
+        if second is not None and second - first == timedelta(seconds=1):
+            self.results.set(key, ('relative', timestamp - base.timestamp()))
+
+        elif second == first:
+            self.results.set(key, ('absolute', timestamp))
+
+        return int(timestamp)
@@ -1,8 +1,11 @@
 import discord
 import sqlalchemy
 
+from caches import LRUCache
+import database
+from consts import RESTRICTION_CACHE_SIZE, RESTRICTION_CACHE_TTL
 from enums import PermissionLevels, CreateReminderResponse
-from models import Guild, User, Language, ENGLISH_STRINGS, CommandRestriction, Role
+from models import Guild, User, Language, ENGLISH_STRINGS, STRINGS
 import typing
 
 
@@ -16,7 +19,7 @@ class Command:
         self.permission_level = permission_level
         self.blacklists = blacklists
 
-    def check_permissions(self, member: discord.Member, guild_data: Guild):
+    def check_permissions(self, member: discord.Member, guild_data: Guild, restrictions: 'RestrictionIndex'):
         if self.permission_level == PermissionLevels.UNRESTRICTED:
             return True
 
@@ -25,17 +28,36 @@ class Command:
                 return True
 
             else:
-                restrict = guild_data.command_restrictions \
-                    .filter(CommandRestriction.command == self.name) \
-                    .join(CommandRestriction.role) \
-                    .filter(Role.role.in_([x.id for x in member.roles]))
+                allowed_roles = restrictions.get(guild_data).get(self.name, frozenset())
 
-                return restrict.count() != 0
+                return not allowed_roles.isdisjoint(x.id for x in member.roles)
 
         elif self.permission_level == PermissionLevels.RESTRICTED:
             return member.guild_permissions.manage_guild
 
 
+class RestrictionIndex:
+    def __init__(self):
+        # guild id -> command name -> discord ids of roles allowed to use it
+        self._guilds: LRUCache = LRUCache(RESTRICTION_CACHE_SIZE, RESTRICTION_CACHE_TTL)
+
+    async def load(self, db: database.Database, guild_id: int):
+        # read a guild's restrictions off the event loop, before its commands check them
+        if self._guilds.get(guild_id) is None:
+            self._guilds.set(guild_id, await db.run(database.command_restrictions, guild_id))
+
+    def get(self, guild: Guild) -> typing.Dict[str, typing.FrozenSet[int]]:
+        if (index := self._guilds.get(guild.id)) is None:
+            # only if the entry expired since load(), so rare enough to read in place
+            index = database.command_restrictions(sqlalchemy.orm.object_session(guild), guild.id)
+            self._guilds.set(guild.id, index)
+
+        return index
+
+    def invalidate(self, guild_id: int):
+        self._guilds.invalidate(guild_id)
+
+
 class Preferences:
     def __init__(self, guild: typing.Optional[Guild], user: User, session: sqlalchemy.orm.session.Session):
         self.user: User = user
@@ -45,8 +67,7 @@ class Preferences:
         timezone_code: str = user.timezone or ('UTC' if guild is None else guild.timezone)
         guild_timezone_code = None if guild is None else guild.timezone
 
-        self._language: typing.Optional[Language] = session.query(Language).filter(
-            Language.code == language_code).first() or ENGLISH_STRINGS
+        self._language: typing.Optional[Language] = STRINGS.language(language_code) or ENGLISH_STRINGS
         self._timezone: str = timezone_code
         self._guild_timezone: str = guild_timezone_code
         self._prefix: str = '$'
@@ -0,0 +1,105 @@
+import asyncio
+import traceback
+import typing
+from datetime import datetime
+from time import time as unix_time
+
+import database
+from caches import LRUCache
+
+
+class PauseSweeper:
+    def __init__(self, db: database.Database, resync_interval: float, channel_cache: typing.Optional[LRUCache] = None):
+        self.database: database.Database = db
+        # discord channel id -> ChannelRecord, whose paused flags are dropped as their pauses are cleared
+        self.channel_cache: typing.Optional[LRUCache] = channel_cache
+        self.resync_interval: float = resync_interval
+
+        self.expired: int = 0
+
+        # channel id -> when its pause ends, or None if it's paused until unpaused
+        self.paused: typing.Dict[int, typing.Optional[float]] = {}
+        self._next_expiry: typing.Optional[float] = None
+
+        self._wake: typing.Optional[asyncio.Event] = None
+        self._task: typing.Optional[asyncio.Task] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def is_paused(self, channel_id: int, now: float) -> bool:
+        if channel_id not in self.paused:
+            return False
+
+        until = self.paused[channel_id]
+
+        return until is None or until > now
+
+    def pause(self, channel_id: int, until: typing.Optional[float]):
+        self.paused[channel_id] = until
+
+        if until is not None and (self._next_expiry is None or until < self._next_expiry):
+            self._next_expiry = until
+
+            if self._wake is not None:
+                self._wake.set()
+
+    def unpause(self, channel_id: int):
+        self.paused.pop(channel_id, None)
+
+    async def _resync(self):
+        # also picks up pauses set outside of the bot, e.g. from the dashboard
+        paused = await self.database.run(database.paused_channels)
+
+        self.paused = dict(paused)
+        self._next_expiry = min((until for until in self.paused.values() if until is not None), default=None)
+
+    async def _sweep(self):
+        expired, next_expiry = await self.database.run(database.expire_pauses, datetime.now())
+
+        for channel_id, discord_channel_id in expired:
+            self.paused.pop(channel_id, None)
+
+            if self.channel_cache is not None:
+                self.channel_cache.invalidate(discord_channel_id)
+
+        self.expired += len(expired)
+        self._next_expiry = next_expiry
+
+    async def _run(self):
+        next_resync = 0
+
+        while True:
+            now = unix_time()
+
+            try:
+                if now >= next_resync:
+                    await self._resync()
+                    next_resync = now + self.resync_interval
+
+                if self._next_expiry is not None and self._next_expiry <= now:
+                    await self._sweep()
+
+            except Exception:
+                print('Failed to clear expired pauses:')
+                traceback.print_exc()
+
+                # retry with the next resync rather than straight away
+                next_resync = now + self.resync_interval
+                self._next_expiry = None
+
+            # sleep until the next pause ends, unless a sooner one is added in the meantime
+            wake_at = next_resync if self._next_expiry is None else min(self._next_expiry, next_resync)
+            self._wake.clear()
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(wake_at - unix_time(), 0))
+            except asyncio.TimeoutError:
+                pass
@@ -1,28 +1,104 @@
-import pytz
+import re
+import typing
 from datetime import datetime
 from time import time as unix_time
 
 from enums import TimeExtractionTypes
+import timezones
+
+# a displacement is a run of "<digits><unit>" terms with optional trailing seconds, e.g "1d2h30m15".
+# a unit assigns (rather than adds to) its field, and anything that doesn't fit falls through to the last group
+DISPLACEMENT_TOKEN = re.compile(r'(\d*)([smhd])|(\d+)\Z|(.)', re.DOTALL)
+
+UNIT_LENGTHS: typing.Dict[str, int] = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+DATE_FIELDS: typing.Tuple[typing.Tuple[str, ...], ...] = ((), (), ('day', 'month'), ('day', 'month', 'year'))
+TIME_FIELDS: typing.Tuple[typing.Tuple[str, ...], ...] = ((), (), ('hour', 'minute'), ('hour', 'minute', 'second'))
 
 
 class InvalidTime(Exception):
     pass
 
 
-class TimeExtractor:
-    def __init__(self, string, timezone=None):
-        self.timezone: str = timezone
+def _displacement(time_string: str) -> int:
+    fields: typing.Dict[str, int] = {}
+    trailing = 0
 
-        if len(string) > 0:
-            self.inverted: bool = string[0] == '-'
-        else:
-            self.inverted: bool = False
+    for digits, unit, end, invalid in DISPLACEMENT_TOKEN.findall(time_string):
+        if unit:
+            fields[unit] = int(digits) if digits else 0
 
-        if self.inverted:
-            self.time_string: str = string[1:]
+        elif end:
+            trailing = int(end)
 
         else:
-            self.time_string: str = string
+            raise InvalidTime()
+
+    return sum(UNIT_LENGTHS[unit] * value for unit, value in fields.items()) + trailing
+
+
+def _explicit_replacements(time_string: str) \
+        -> typing.Tuple[typing.List[typing.Dict[str, int]], typing.Optional[Exception]]:
+    # the replacements made by each "-" separated clump, and the error that stopped parsing early, if any
+    replacements: typing.List[typing.Dict[str, int]] = []
+
+    try:
+        for clump in time_string.split('-'):
+            if '/' in clump:
+                parts = clump.split('/')
+
+                # a date with too many parts is ignored rather than rejected
+                if len(parts) in (2, 3):
+                    replacements.append({field: int(part) for field, part in zip(DATE_FIELDS[len(parts)], parts)})
+
+            elif ':' in clump:
+                parts = clump.split(':')
+
+                if len(parts) not in (2, 3):
+                    raise InvalidTime()
+
+                replacements.append({field: int(part) for field, part in zip(TIME_FIELDS[len(parts)], parts)})
+
+            else:
+                replacements.append({'day': int(clump)})
+
+    except (ValueError, InvalidTime) as e:
+        return replacements, e
+
+    return replacements, None
+
+
+def _explicit(time_string: str, now: datetime) -> float:
+    replacements, error = _explicit_replacements(time_string)
+    merged = {}
+
+    for replacement in replacements:
+        merged.update(replacement)
+
+    # one replace is only equivalent to several when no field is set twice. if anything goes wrong, replay the
+    # replacements one at a time so the failure is the same as it always was
+    if error is None and len(merged) == sum(len(replacement) for replacement in replacements):
+        try:
+            return now.replace(**merged).timestamp()
+
+        except Exception:
+            pass
+
+    for replacement in replacements:
+        now = now.replace(**replacement)
+
+    if error is not None:
+        raise error
+
+    return now.timestamp()
+
+
+class TimeExtractor:
+    def __init__(self, string, timezone=None):
+        self.timezone: str = timezone
+
+        self.inverted: bool = string[:1] == '-'
+        self.time_string: str = string[1:] if self.inverted else string
 
         if '/' in string or ':' in string:
             self.process_type = TimeExtractionTypes.EXPLICIT
@@ -30,84 +106,45 @@ class TimeExtractor:
         else:
             self.process_type = TimeExtractionTypes.DISPLACEMENT
 
-    def extract_exact(self) -> int:  # produce a timestamp
-        return int(self._process_spaceless())
+    def extract_exact(self, now: typing.Optional[float] = None) -> int:  # produce a timestamp
+        return int(self._process_spaceless(now))
 
-    def extract_displacement(self) -> int:  # produce a relative time
-        return int(round(self._process_spaceless() - unix_time()))
+    def extract_displacement(self, now: typing.Optional[float] = None) -> int:  # produce a relative time
+        return int(round(self._process_spaceless(now) - (unix_time() if now is None else now)))
 
-    def _process_spaceless(self) -> float:
+    def _process_spaceless(self, now: typing.Optional[float]) -> float:
         if self.process_type == TimeExtractionTypes.EXPLICIT:
+            tz = timezones.get(self.timezone)
+            date = datetime.now(tz) if now is None else datetime.fromtimestamp(now, tz)
+
             try:
-                d = self._process_explicit()
+                return _explicit(self.time_string, date)
+
             except ValueError:
                 raise InvalidTime()
-            return d
 
         else:
-            d = self._process_displacement()
-            return unix_time() + d
+            d = _displacement(self.time_string)
 
-    def _process_explicit(self) -> float:  # processing times that dictate a specific time
-        date = datetime.now(pytz.timezone(self.timezone))
+            if self.inverted:
+                d = -d
 
-        for clump in self.time_string.split('-'):
-            if '/' in clump:
-                a = clump.split('/')
-                if len(a) == 2:
-                    date = date.replace(month=int(a[1]), day=int(a[0]))
-                elif len(a) == 3:
-                    date = date.replace(year=int(a[2]), month=int(a[1]), day=int(a[0]))
+            return (unix_time() if now is None else now) + d
 
-            elif ':' in clump:
-                a = clump.split(':')
-                if len(a) == 2:
-                    date = date.replace(hour=int(a[0]), minute=int(a[1]))
-                elif len(a) == 3:
-                    date = date.replace(hour=int(a[0]), minute=int(a[1]), second=int(a[2]))
-                else:
-                    raise InvalidTime()
-
-            else:
-                date = date.replace(day=int(clump))
-
-        return date.timestamp()
-
-    def _process_displacement(self) -> int:  # processing times that dictate a time relative to now
-        current_buffer = '0'
-        seconds = 0
-        minutes = 0
-        hours = 0
-        days = 0
 
-        for char in self.time_string:
+def extract_many(items: typing.Iterable[typing.Tuple[str, typing.Optional[str]]], displacement: bool = False) \
+        -> typing.List[typing.Optional[int]]:
+    # parse many (string, timezone) pairs against the same moment. invalid times come back as None
+    now = unix_time()
+    results: typing.List[typing.Optional[int]] = []
 
-            if char == 's':
-                seconds = int(current_buffer)
-                current_buffer = '0'
-
-            elif char == 'm':
-                minutes = int(current_buffer)
-                current_buffer = '0'
-
-            elif char == 'h':
-                hours = int(current_buffer)
-                current_buffer = '0'
-
-            elif char == 'd':
-                days = int(current_buffer)
-                current_buffer = '0'
-
-            else:
-                try:
-                    int(char)
-                    current_buffer += char
-                except ValueError:
-                    raise InvalidTime()
+    for string, timezone in items:
+        extractor = TimeExtractor(string, timezone)
 
-        full = seconds + (minutes * 60) + (hours * 3600) + (days * 86400) + int(current_buffer)
+        try:
+            results.append(extractor.extract_displacement(now) if displacement else extractor.extract_exact(now))
 
-        if self.inverted:
-            full = -full
+        except InvalidTime:
+            results.append(None)
 
-        return full
+    return results
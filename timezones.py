@@ -0,0 +1,83 @@
+import bisect
+import difflib
+import typing
+from collections import defaultdict
+from datetime import tzinfo
+from functools import lru_cache
+
+import pytz
+
+# hashed, so validating a name doesn't walk pytz's list of ~600 zones
+ZONE_NAMES: typing.FrozenSet[str] = frozenset(pytz.all_timezones)
+COMMON_ZONE_NAMES: typing.FrozenSet[str] = frozenset(pytz.common_timezones)
+
+
+def _key(text: str) -> str:
+    return '_'.join(text.strip().lower().split())
+
+
+def _build_index() -> typing.Dict[str, typing.Tuple[str, ...]]:
+    # search key -> every zone it could mean. keys are whole names ("europe/london") and their last part ("london")
+    candidates: typing.DefaultDict[str, typing.Set[str]] = defaultdict(set)
+
+    for name in ZONE_NAMES:
+        key = _key(name)
+
+        candidates[key].add(name)
+        candidates[key.rsplit('/', 1)[-1]].add(name)
+
+    return {key: tuple(sorted(names)) for key, names in candidates.items()}
+
+
+INDEX: typing.Dict[str, typing.Tuple[str, ...]] = _build_index()
+SORTED_KEYS: typing.List[str] = sorted(INDEX)
+
+
+@lru_cache(maxsize=None)
+def get(name: str) -> tzinfo:
+    return pytz.timezone(name)
+
+
+def _pick(names: typing.Collection[str]) -> typing.Optional[str]:
+    # a key that means several zones is only usable if just one of them is in common use
+    if len(names) == 1:
+        return next(iter(names))
+
+    common = [name for name in names if name in COMMON_ZONE_NAMES]
+
+    return common[0] if len(common) == 1 else None
+
+
+@lru_cache(maxsize=4096)
+def resolve(text: str) -> typing.Optional[str]:
+    # the zone name meant by some user input, e.g "london" or "us/eastern", or None if it's unclear
+    if text in ZONE_NAMES:
+        return text
+
+    key = _key(text)
+
+    if not key:
+        return None
+
+    elif key in INDEX:
+        return _pick(INDEX[key])
+
+    # keys starting with the input sort together, so a prefix is found by bisection
+    start = bisect.bisect_left(SORTED_KEYS, key)
+    end = bisect.bisect_left(SORTED_KEYS, key + '￿', lo=start)
+
+    if start < end:
+        return _pick({name for k in SORTED_KEYS[start:end] for name in INDEX[k]})
+
+    # typos are only looked for among keys sharing a first letter
+    close = difflib.get_close_matches(key, _keys_starting_with(key[0]), n=1, cutoff=0.8)
+
+    return _pick(INDEX[close[0]]) if close else None
+
+
+@lru_cache(maxsize=None)
+def _keys_starting_with(letter: str) -> typing.List[str]:
+    start = bisect.bisect_left(SORTED_KEYS, letter)
+    end = bisect.bisect_left(SORTED_KEYS, letter + '￿', lo=start)
+
+    return SORTED_KEYS[start:end]
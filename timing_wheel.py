@@ -0,0 +1,154 @@
+import typing
+
+Key = typing.Hashable
+
+
+# a hierarchical timing wheel. level 0 has one slot per tick, and each slot of a higher level covers a full turn of
+# the level below it, which its entries are cascaded down into when that turn begins. insert and cancel are O(1)
+class TimingWheel:
+    def __init__(self, resolution: float, slots: typing.Sequence[int]):
+        self.resolution: float = resolution
+        self.slots: typing.Tuple[int, ...] = tuple(slots)
+
+        # ticks covered by one slot at each level
+        self._granularity: typing.List[int] = [1]
+        for count in self.slots[:-1]:
+            self._granularity.append(self._granularity[-1] * count)
+
+        # how far ahead of the current tick an entry can always be placed. a little more fits, depending on where the
+        # current tick is in the top level's turn
+        self.span: int = self._granularity[-1] * (self.slots[-1] - 1)
+
+        self._levels: typing.List[typing.List[typing.Dict[Key, float]]] = [
+            [{} for _ in range(count)] for count in self.slots]
+        # key -> (level, slot), or None for entries already due
+        self._where: typing.Dict[Key, typing.Optional[typing.Tuple[int, int]]] = {}
+        self._overdue: typing.Dict[Key, float] = {}
+
+        # the next tick to be processed
+        self._tick: typing.Optional[int] = None
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key: Key):
+        return key in self._where
+
+    def fits(self, time: float) -> bool:
+        granularity, count = self._granularity[-1], self.slots[-1]
+
+        return self._tick is None or int(time // self.resolution) // granularity - self._tick // granularity < count
+
+    def insert(self, key: Key, time: float) -> bool:
+        # returns False if the time is too far ahead for the wheel
+        if key in self._where:
+            self.cancel(key)
+
+        tick = int(time // self.resolution)
+
+        if self._tick is None:
+            self._tick = tick
+
+        if tick < self._tick:
+            self._overdue[key] = time
+            self._where[key] = None
+
+            return True
+
+        # the lowest level whose turn reaches the tick. a slot on a higher level is never the current one, as that
+        # was cascaded when its turn began
+        for level, (granularity, count) in enumerate(zip(self._granularity, self.slots)):
+            if tick // granularity - self._tick // granularity < count:
+                slot = (tick // granularity) % count
+
+                self._levels[level][slot][key] = time
+                self._where[key] = (level, slot)
+
+                return True
+
+        return False
+
+    def cancel(self, key: Key) -> bool:
+        if key not in self._where:
+            return False
+
+        position = self._where.pop(key)
+
+        if position is None:
+            del self._overdue[key]
+        else:
+            level, slot = position
+            del self._levels[level][slot][key]
+
+        return True
+
+    def advance(self, now: float) -> typing.List[typing.Tuple[Key, float]]:
+        # remove and return every entry due at or before now
+        due: typing.List[typing.Tuple[Key, float]] = list(self._overdue.items())
+        self._overdue.clear()
+
+        target = int(now // self.resolution)
+
+        if self._tick is None or not self._where:
+            # nothing to step through
+            self._tick = target + 1
+
+        while self._tick <= target:
+            for level in range(len(self.slots) - 1, 0, -1):
+                if self._tick % self._granularity[level] == 0:
+                    self._cascade(level)
+
+            bucket = self._levels[0][self._tick % self.slots[0]]
+
+            if bucket:
+                due.extend(bucket.items())
+                bucket.clear()
+
+            self._tick += 1
+
+            if len(due) == len(self._where):
+                # everything left is due, so skip the empty ticks between here and now
+                self._tick = target + 1
+
+        for key, _ in due:
+            del self._where[key]
+
+        return due
+
+    def next_due(self) -> typing.Optional[float]:
+        # the earliest time advance() might return something, or None if the wheel is empty
+        if self._overdue:
+            return 0
+
+        elif not self._where:
+            return None
+
+        earliest = None
+
+        for offset in range(self.slots[0]):
+            if self._levels[0][(self._tick + offset) % self.slots[0]]:
+                earliest = self._tick + offset
+                break
+
+        # a higher level's entries come due no earlier than the start of the turn its slot is cascaded at
+        for level in range(1, len(self.slots)):
+            granularity, count = self._granularity[level], self.slots[level]
+            block = self._tick // granularity
+
+            # the current slot still counts if its turn begins at the next tick, so hasn't been cascaded yet
+            for offset in range(0 if self._tick % granularity == 0 else 1, count):
+                if self._levels[level][(block + offset) % count]:
+                    start = (block + offset) * granularity
+                    earliest = start if earliest is None else min(earliest, start)
+                    break
+
+        return None if earliest is None else earliest * self.resolution
+
+    def _cascade(self, level: int):
+        slot = (self._tick // self._granularity[level]) % self.slots[level]
+        bucket = self._levels[level][slot]
+        self._levels[level][slot] = {}
+
+        for key, time in bucket.items():
+            del self._where[key]
+            self.insert(key, time)
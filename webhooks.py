@@ -0,0 +1,130 @@
+import asyncio
+import typing
+from time import time as unix_time
+
+import aiohttp
+
+WEBHOOK_URL: str = 'https://discord.com/api/webhooks/{}/{}'
+
+
+class WebhookError(Exception):
+    def __init__(self, status: int, text: str):
+        super(WebhookError, self).__init__('{}: {}'.format(status, text))
+
+        self.status: int = status
+
+
+class _Route:
+    __slots__ = ('lock', 'remaining', 'reset_at', 'users')
+
+    def __init__(self):
+        # held while a request is made, so requests to the same webhook queue up in order behind it
+        self.lock: asyncio.Lock = asyncio.Lock()
+        self.remaining: typing.Optional[int] = None
+        self.reset_at: float = 0
+        self.users: int = 0
+
+
+class WebhookSender:
+    def __init__(self, concurrency: int, max_attempts: int):
+        self.concurrency: int = concurrency
+        self.max_attempts: int = max_attempts
+
+        self.sent: int = 0
+        self.rate_limited: int = 0
+
+        self._session: typing.Optional[aiohttp.ClientSession] = None
+        self._slots: typing.Optional[asyncio.Semaphore] = None
+
+        # webhook id -> its rate limit state. Discord buckets webhook executions per webhook
+        self._routes: typing.Dict[int, _Route] = {}
+        self._global_reset_at: float = 0
+
+    def start(self, session: aiohttp.ClientSession):
+        self._session = session
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+
+    async def send(self, webhook_id: int, webhook_token: str, payload: dict):
+        route = self._routes.get(webhook_id)
+
+        if route is None:
+            route = self._routes[webhook_id] = _Route()
+
+        route.users += 1
+
+        try:
+            async with route.lock:
+                await self._send(route, WEBHOOK_URL.format(webhook_id, webhook_token), payload)
+
+        finally:
+            route.users -= 1
+
+            if route.users == 0:
+                wait = route.reset_at - unix_time()
+
+                if route.remaining == 0 and wait > 0:
+                    # keep the state of a route that's still limited, so the next burst to it waits instead of
+                    # hitting a 429, but only until its limit resets
+                    asyncio.get_running_loop().call_later(wait, self._prune, webhook_id, route)
+
+                else:
+                    del self._routes[webhook_id]
+
+    def _prune(self, webhook_id: int, route: _Route):
+        # unless it's been used again since, and so will be pruned when that's done
+        if route.users == 0 and self._routes.get(webhook_id) is route:
+            del self._routes[webhook_id]
+
+    async def _send(self, route: _Route, url: str, payload: dict):
+        for _ in range(self.max_attempts):
+            # wait out any known limit rather than sending a request that's bound to be refused
+            wait = max(self._global_reset_at, route.reset_at if route.remaining == 0 else 0) - unix_time()
+
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            async with self._slots:
+                async with self._session.post(url, json=payload) as response:
+                    self._update(route, response.headers)
+
+                    if response.status == 429:
+                        self.rate_limited += 1
+                        retry_after = await self._retry_after(response)
+
+                        if response.headers.get('X-RateLimit-Global'):
+                            self._global_reset_at = unix_time() + retry_after
+                        else:
+                            route.remaining = 0
+                            route.reset_at = unix_time() + retry_after
+
+                        continue
+
+                    elif response.status >= 400:
+                        raise WebhookError(response.status, await response.text())
+
+                    self.sent += 1
+                    return
+
+        raise WebhookError(429, 'still rate limited after {} attempts'.format(self.max_attempts))
+
+    @staticmethod
+    def _update(route: _Route, headers: typing.Mapping[str, str]):
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After')
+
+        if remaining is not None and reset_after is not None:
+            route.remaining = int(remaining)
+            route.reset_at = unix_time() + float(reset_after)
+
+    @staticmethod
+    async def _retry_after(response: aiohttp.ClientResponse) -> float:
+        if response.headers.get('Retry-After') is not None:
+            return float(response.headers['Retry-After'])
+
+        try:
+            return float((await response.json(content_type=None))['retry_after'])
+
+        except (ValueError, KeyError, TypeError):
+            return 1